@@ -1,27 +1,47 @@
+import itertools
+import queue
+import re
 import threading
 import serial
 import serial.tools.list_ports
 import time
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 from dataclasses import dataclass
-from enum import Enum
+from enum import Enum, IntEnum
+from Metriques import REGISTRE
+from Traces import TRACEUR
+
+LATENCE_ACQUITTEMENT = REGISTRE.histogramme(
+    'ch340_acquittement_secondes', "Délai entre l'écriture d'une commande et l'écho CHn: du module")
+LATENCE_ENTREE = REGISTRE.histogramme(
+    'ch340_entree_detection_secondes', "Délai entre l'arrivée d'un changement d'entrée et sa notification")
+ECRITURES = REGISTRE.compteur('ch340_ecritures_total', 'Commandes écrites sur le port série')
+
+
+def find_ch340_ports() -> List:
+    """
+    Retourne les informations (ListPortInfo) de tous les CH340 au VID:PID 1a86:7523,
+    triées par chemin physique USB pour un ordre stable d'un démarrage à l'autre
+    """
+    ports = [
+        port for port in serial.tools.list_ports.comports()
+        if port.vid == 0x1a86 and port.pid == 0x7523
+    ]
+    return sorted(ports, key=lambda port: (port.location or '', port.device))
 
 
 def find_ch340_port() -> Optional[str]:
     """
     Cherche et retourne le port du CH340 spécifiquement pour le VID:PID 1a86:7523
     """
-    ports = serial.tools.list_ports.comports()
-    for port in ports:
-        # Vérifie spécifiquement le VID:PID de votre CH340
-        if port.vid == 0x1a86 and port.pid == 0x7523:
-            try:
-                # Essaie d'ouvrir le port en lecture/écriture
-                with serial.Serial(port.device) as ser:
-                    pass
-                return port.device
-            except Exception as e:
-                raise PermissionError(f"Erreur d'accès au port  {port.device}: {e}")
+    for port in find_ch340_ports():
+        try:
+            # Essaie d'ouvrir le port en lecture/écriture
+            with serial.Serial(port.device) as ser:
+                pass
+            return port.device
+        except Exception as e:
+            raise PermissionError(f"Erreur d'accès au port  {port.device}: {e}")
     return None
 
 
@@ -33,6 +53,152 @@ class RelayState(Enum):
         return 'On' if self == RelayState.ON else 'Off'
 
 
+class EntreeNumerique:
+    """
+    Canal du module utilisé en entrée (retour ON / OFF), avec anti-rebond et notification des changements.
+
+    Un nouvel état n'est confirmé que s'il se maintient `anti_rebond` secondes sans message contraire ;
+    les abonnés reçoivent alors (canal, état, instant d'arrivée du premier message en perf_counter()).
+    """
+
+    def __init__(self, canal: int, anti_rebond: float = 0.05):
+        self.canal = canal
+        self.anti_rebond = anti_rebond
+        self.etat: Optional[RelayState] = None
+        self.horodatage: Optional[float] = None
+        self.candidat: Optional[RelayState] = None
+        self.candidat_depuis = 0.0
+        self.abonnes: List[Callable[[int, RelayState, float], None]] = []
+
+    def abonner(self, rappel: Callable[[int, RelayState, float], None]):
+        self.abonnes.append(rappel)
+
+    def recevoir(self, etat: RelayState, arrivee: float):
+        """Prend en compte un message reçu pour ce canal."""
+        if etat == self.etat:
+            self.candidat = None  # Rebond : retour à l'état confirmé
+            return
+        if etat != self.candidat:
+            self.candidat = etat
+            self.candidat_depuis = arrivee
+        self.echeance(arrivee)
+
+    def echeance(self, maintenant: float):
+        """Confirme l'état candidat si l'anti-rebond est écoulé."""
+        if self.candidat is not None and maintenant - self.candidat_depuis >= self.anti_rebond:
+            self.etat, self.horodatage = self.candidat, self.candidat_depuis
+            self.candidat = None
+            for rappel in self.abonnes:
+                try:
+                    rappel(self.canal, self.etat, self.horodatage)
+                except Exception:
+                    pass  # Un abonné défaillant ne doit pas bloquer la lecture du port
+
+
+class PrioriteCommande(IntEnum):
+    """Classes de trafic série, de la plus prioritaire à la moins prioritaire."""
+    SECURITE = 0
+    CONTROLE = 1
+    UTILISATEUR = 2
+    INTERROGATION = 3
+
+
+class OrdonnanceurSerie:
+    """
+    Seul thread autorisé à écrire sur le port série.
+
+    Les commandes sont servies par priorité (puis dans l'ordre d'arrivée au sein d'une même classe),
+    avec un espacement minimal entre deux écritures pour ne pas saturer le module CH340. Une commande
+    de sécurité passe donc devant tout le trafic en attente, sans interrompre l'écriture en cours.
+    """
+
+    def __init__(self, port, apres_ecriture: Callable[[bytes, Sequence[int]], None], espacement: float = 0.02,
+                 carte: Optional[str] = None):
+        self.port = port
+        self.apres_ecriture = apres_ecriture
+        self.espacement = espacement
+        self.file: queue.PriorityQueue = queue.PriorityQueue()
+        self.sequence = itertools.count()
+        self.verrou = threading.Lock()
+        self.profondeurs = {priorite: 0 for priorite in PrioriteCommande}
+        # Une série de métriques par carte : « ch340_<carte>_… » quand plusieurs cartes sont ouvertes
+        prefixe = 'ch340_' if carte is None else f"ch340_{re.sub(r'[^a-zA-Z0-9_]', '_', carte)}_"
+        de_la_carte = '' if carte is None else f" (carte {carte})"
+        self.attente = {
+            priorite: REGISTRE.histogramme(
+                f'{prefixe}attente_{priorite.name.lower()}_secondes',
+                f"Attente en file des commandes de classe {priorite.name.lower()}{de_la_carte}")
+            for priorite in PrioriteCommande
+        }
+        self.jauges = {
+            priorite: REGISTRE.jauge(
+                f'{prefixe}file_{priorite.name.lower()}',
+                f"Commandes de classe {priorite.name.lower()} en attente{de_la_carte}")
+            for priorite in PrioriteCommande
+        }
+        self.derniere_ecriture = 0.0
+        self.running = True
+        self.thread = threading.Thread(target=self._ecrire_en_continu, name='ecriture-serie', daemon=True)
+        self.thread.start()
+
+    def soumettre(self, cmd: bytes, priorite: PrioriteCommande, canaux: Sequence[int] = ()) -> threading.Event:
+        """Met une commande en file ; l'événement retourné est levé une fois la commande écrite."""
+        ecrite = threading.Event()
+        with self.verrou:
+            self.profondeurs[priorite] += 1
+            self.jauges[priorite].definir(self.profondeurs[priorite])
+        self.file.put((priorite, next(self.sequence), cmd, canaux, time.perf_counter(), ecrite))
+        return ecrite
+
+    def _ecrire_en_continu(self):
+        while self.running:
+            # L'espacement est respecté avant de choisir la commande : une commande de sécurité
+            # arrivée pendant ce délai passe encore devant le trafic déjà en file
+            delai = self.derniere_ecriture + self.espacement - time.perf_counter()
+            if delai > 0:
+                time.sleep(delai)
+            try:
+                priorite, _, cmd, canaux, soumission, ecrite = self.file.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            with self.verrou:
+                self.profondeurs[priorite] -= 1
+                self.jauges[priorite].definir(self.profondeurs[priorite])
+
+            self.attente[priorite].observer(time.perf_counter() - soumission)
+            try:
+                with TRACEUR.span('serie.ecriture', {'commande': cmd.decode(), 'priorite': priorite.name}
+                                  if TRACEUR.actif else None):
+                    self.port.write(cmd)
+                self.derniere_ecriture = time.perf_counter()
+                self.apres_ecriture(cmd, canaux)
+            except Exception:
+                pass  # Port fermé ou en erreur : la commande est perdue, comme une écriture directe
+            ecrite.set()
+            self.file.task_done()
+
+    def statistiques(self) -> Dict[str, dict]:
+        """Profondeur de file et attente moyenne / totale par classe."""
+        stats = {}
+        for priorite in PrioriteCommande:
+            comptes, somme = self.attente[priorite].totaux()
+            nombre = sum(comptes)
+            stats[priorite.name.lower()] = {
+                'profondeur': self.profondeurs[priorite],
+                'commandes': nombre,
+                'attente_moyenne': somme / nombre if nombre else 0.0,
+            }
+        return stats
+
+    def attendre_vidage(self):
+        """Bloque jusqu'à ce que toutes les commandes soumises aient été écrites."""
+        self.file.join()
+
+    def arreter(self):
+        self.running = False
+        self.thread.join(timeout=1.0)
+
+
 @dataclass
 class RelayCommand:
     ON: bytes
@@ -41,16 +207,32 @@ class RelayCommand:
 
 
 class RelayController:
-    def __init__(self, port: Optional[str] = None, baudrate: int = 9600, num_relays: int = 8):
-        # Si aucun port n'est spécifié, cherche automatiquement le CH340
-        if port is None:
-            port = find_ch340_port()
+    def __init__(self, port: Optional[str] = None, baudrate: int = 9600, num_relays: int = 8,
+                 enregistreur=None, serial_port=None, canaux_entree: Sequence[int] = (7, 8),
+                 anti_rebond: float = 0.05, delai_lecture: float = 0.01, espacement: float = 0.02,
+                 carte: Optional[str] = None):
+        if serial_port is not None:
+            # Port déjà ouvert (PortSimule pour les tests et le rejeu de sessions)
+            self.serial_port = serial_port
+        else:
+            # Si aucun port n'est spécifié, cherche automatiquement le CH340
             if port is None:
-                raise Exception("Aucun CH340 trouvé. Vérifiez la connexion USB.")
+                port = find_ch340_port()
+                if port is None:
+                    raise Exception("Aucun CH340 trouvé. Vérifiez la connexion USB.")
+            # readline() bloque au plus `delai_lecture` secondes : pas d'attente active ni de sommeil fixe
+            self.serial_port = serial.Serial(port, baudrate, timeout=delai_lecture)
 
-        self.serial_port = serial.Serial(port, baudrate)
+        self.enregistreur = enregistreur
+        self.carte = carte
         self.num_relays = num_relays
         self.states = [RelayState.OFF] * num_relays
+        self.envois_en_attente: List[Optional[float]] = [None] * num_relays  # perf_counter() de la dernière écriture
+        self.entrees: Dict[int, EntreeNumerique] = {
+            canal: EntreeNumerique(canal, anti_rebond) for canal in canaux_entree if 1 <= canal <= num_relays
+        }
+        for entree in self.entrees.values():
+            entree.abonner(self._sur_changement_entree)
         self.running = True
 
         # Définition des commandes
@@ -64,6 +246,20 @@ class RelayController:
         self.all_on_cmd = b'AT+AO'
         self.all_off_cmd = b'AT+AC'
 
+        # États effectivement écrits sur le module, pour signaler les transitions des sorties
+        self.etats_ecrits: List[Optional[RelayState]] = [None] * num_relays
+        self.abonnes_transitions: List[Callable[[int, RelayState], None]] = []
+        self.effets_commandes: Dict[bytes, Tuple[Tuple[int, RelayState], ...]] = {
+            self.all_on_cmd: tuple((i + 1, RelayState.ON) for i in range(num_relays)),
+            self.all_off_cmd: tuple((i + 1, RelayState.OFF) for i in range(num_relays)),
+        }
+        for i, commande in enumerate(self.commands):
+            self.effets_commandes[commande.ON] = ((i + 1, RelayState.ON),)
+            self.effets_commandes[commande.OFF] = ((i + 1, RelayState.OFF),)
+
+        # Toutes les écritures passent par un thread unique, par ordre de priorité
+        self.ordonnanceur = OrdonnanceurSerie(self.serial_port, self._apres_ecriture, espacement, carte)
+
         # Démarrage du thread de lecture
         self.reader_thread = threading.Thread(target=self._read_from_port, daemon=True)
         self.reader_thread.start()
@@ -72,14 +268,18 @@ class RelayController:
         """Lit en continu les messages du port série."""
         while self.running:
             try:
-                if self.serial_port.in_waiting:
-                    chars = self.serial_port.readline()
-                    self._process_message(chars)
+                chars = self.serial_port.readline()
+                arrivee = time.perf_counter()
+                if chars:
+                    if self.enregistreur is not None:
+                        self.enregistreur.serie_rx(chars, self.carte)
+                    self._process_message(chars, arrivee)
+                for entree in self.entrees.values():
+                    entree.echeance(arrivee)
             except Exception:
-                pass
-            time.sleep(0.1)  # Évite une utilisation CPU excessive
+                time.sleep(0.1)  # Évite une boucle active si le port est en erreur
 
-    def _process_message(self, chars):
+    def _process_message(self, chars, arrivee: Optional[float] = None):
         """Traite les messages entrants du module relais."""
         parts = chars.split()
         if len(parts) == 2:
@@ -87,27 +287,90 @@ class RelayController:
             state_map = {b'OFF': RelayState.OFF, b'ON': RelayState.ON}
             channel = channel_map.get(parts[0])
             state = state_map.get(parts[1])
-            if channel is not None and state is not None:
+            if channel is None or state is None:
+                return
+            if channel in self.entrees:
+                self.entrees[channel].recevoir(state, time.perf_counter() if arrivee is None else arrivee)
+            else:
                 self.states[channel - 1] = state
+                envoi = self.envois_en_attente[channel - 1]
+                if envoi is not None:
+                    LATENCE_ACQUITTEMENT.observer(time.perf_counter() - envoi)
+                    self.envois_en_attente[channel - 1] = None
+                if TRACEUR.attentes:
+                    TRACEUR.fermer_attente(f'relais{channel}.acquittement', {'etat': str(state)})
 
-    def toggle_relay(self, relay_num: int):
+    def _sur_changement_entree(self, canal: int, etat: RelayState, arrivee: float):
+        """Les entrées ne reflètent dans `states` que leur état confirmé (après anti-rebond)."""
+        self.states[canal - 1] = etat
+        LATENCE_ENTREE.observer(time.perf_counter() - arrivee)
+
+    def toggle_relay(self, relay_num: int, priorite: PrioriteCommande = PrioriteCommande.UTILISATEUR):
         """Change l'état d'un relais spécifique."""
         if 1 <= relay_num <= self.num_relays:
-            idx = relay_num - 1
-            new_state = RelayState.OFF if self.states[idx] == RelayState.ON else RelayState.ON
-            cmd = self.commands[idx].OFF if new_state == RelayState.OFF else self.commands[idx].ON
-            self.serial_port.write(cmd)
-            self.states[idx] = new_state
-
-    def set_all_relays(self, state: RelayState):
-        """Change l'état de tous les relais."""
+            new_state = RelayState.OFF if self.states[relay_num - 1] == RelayState.ON else RelayState.ON
+            self.definir_relais(relay_num, new_state, priorite)
+
+    def definir_relais(self, relay_num: int, state: RelayState,
+                       priorite: PrioriteCommande = PrioriteCommande.CONTROLE) -> threading.Event:
+        """Impose un état à un relais, quel que soit l'état connu ; l'événement est levé une fois écrit."""
+        if not 1 <= relay_num <= self.num_relays:
+            raise ValueError(f"Relais {relay_num} invalide (1 à {self.num_relays})")
+        idx = relay_num - 1
+        cmd = self.commands[idx].ON if state == RelayState.ON else self.commands[idx].OFF
+        if TRACEUR.actif:
+            TRACEUR.ouvrir_attente(f'relais{relay_num}.acquittement')
+        with TRACEUR.span('serie.soumission', {'commande': cmd.decode()} if TRACEUR.actif else None):
+            ecrite = self.ordonnanceur.soumettre(cmd, priorite, (relay_num,))
+        self.states[idx] = state
+        return ecrite
+
+    def forcer_relais(self, relay_num: int, state: RelayState) -> threading.Event:
+        """
+        Chemin rapide réservé à la sécurité : impose un état, quel que soit l'état connu.
+        La commande passe devant tout le trafic en attente ; l'événement retourné est levé une fois écrite.
+        """
+        return self.definir_relais(relay_num, state, PrioriteCommande.SECURITE)
+
+    def set_all_relays(self, state: RelayState, priorite: PrioriteCommande = PrioriteCommande.UTILISATEUR):
+        """Change l'état de tous les relais (les entrées gardent leur dernier état confirmé)."""
         cmd = self.all_on_cmd if state == RelayState.ON else self.all_off_cmd
-        self.serial_port.write(cmd)
-        self.states = [state] * self.num_relays
+        self.ordonnanceur.soumettre(cmd, priorite, range(1, self.num_relays + 1))
+        for idx in range(self.num_relays):
+            if idx + 1 not in self.entrees:
+                self.states[idx] = state
+
+    def demander_etat(self, relay_num: int):
+        """Interroge le module sur l'état d'un relais (trafic de plus basse priorité)."""
+        if 1 <= relay_num <= self.num_relays:
+            self.ordonnanceur.soumettre(self.commands[relay_num - 1].STATUS, PrioriteCommande.INTERROGATION)
+
+    def abonner_transitions(self, rappel: Callable[[int, RelayState], None]):
+        """
+        `rappel(canal, etat)` est appelé par le thread d'écriture chaque fois qu'une commande écrite
+        change l'état d'une sortie ; il doit rester bref.
+        """
+        self.abonnes_transitions.append(rappel)
+
+    def _apres_ecriture(self, cmd: bytes, canaux: Sequence[int]):
+        """Appelé par le thread d'écriture juste après l'envoi d'une commande."""
+        instant = time.perf_counter()
+        for canal in canaux:
+            self.envois_en_attente[canal - 1] = instant
+        ECRITURES.incrementer()
+        if self.enregistreur is not None:
+            self.enregistreur.serie_tx(cmd, self.carte)
+        for canal, etat in self.effets_commandes.get(cmd, ()):
+            if self.etats_ecrits[canal - 1] != etat:
+                self.etats_ecrits[canal - 1] = etat
+                for rappel in self.abonnes_transitions:
+                    rappel(canal, etat)
 
     def cleanup(self):
         """Nettoie les ressources."""
         self.running = False
+        if hasattr(self, 'ordonnanceur'):
+            self.ordonnanceur.arreter()
         if hasattr(self, 'serial_port') and self.serial_port.is_open:
             self.serial_port.close()
         if hasattr(self, 'reader_thread'):
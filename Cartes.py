@@ -0,0 +1,223 @@
+import json
+import os
+from dataclasses import dataclass
+import threading
+from typing import Callable, Dict, List, Tuple
+from CH340 import EntreeNumerique, PrioriteCommande, RelayController, RelayState, find_ch340_ports
+
+# Affectation par défaut d'un poêle sur une carte (voir le câblage dans Main.py)
+CANAUX_POELE = {
+    'moteur_fumee': 1,
+    'moteur_ventilation': 2,
+    'vis_pellet': 3,
+    'resistance': 4,
+    'coupe_circuit': 7,
+    'presosta': 8,
+}
+
+
+@dataclass(frozen=True)
+class Sortie:
+    """Sortie logique d'un poêle, rattachée à un canal d'une carte."""
+    carte: str
+    canal: int
+
+
+def identifiant_port(port) -> str:
+    """
+    Identifiant stable d'une carte : numéro de série USB s'il existe, sinon chemin physique USB.
+    Les CH340 n'ont généralement pas de numéro de série : c'est alors le port USB utilisé qui identifie la carte.
+    """
+    if port.serial_number:
+        return port.serial_number
+    if port.location:
+        return f"usb-{port.location}"
+    return port.device
+
+
+class RegistreCartes:
+    """
+    Ensemble des cartes relais d'un même processus et affectation des sorties logiques de chaque poêle.
+
+    Chaque RelayController possède ses propres threads de lecture et d'écriture : une carte lente
+    ou déconnectée ne retarde pas les commandes destinées aux autres.
+    """
+
+    def __init__(self):
+        self.cartes: Dict[str, RelayController] = {}
+        self.sorties: Dict[Tuple[str, str], Sortie] = {}
+        self.erreurs: Dict[str, str] = {}  # Cartes présentes mais inutilisables, à journaliser par l'appelant
+
+    def decouvrir(self, fabrique: Callable[..., RelayController] = RelayController, **options) -> List[str]:
+        """
+        Ouvre tous les CH340 présents ; retourne les identifiants des cartes ajoutées.
+        Une carte qui ne peut être ouverte (droits, débranchée entre-temps) est notée dans `erreurs` et ignorée.
+        """
+        ajoutees = []
+        for port in find_ch340_ports():
+            identifiant = identifiant_port(port)
+            if identifiant in self.cartes:
+                continue
+            try:
+                controleur = fabrique(port=port.device, carte=identifiant, **options)
+            except Exception as e:
+                self.erreurs[identifiant] = f"{port.device}: {e}"
+                continue
+            self.erreurs.pop(identifiant, None)
+            self.ajouter_carte(identifiant, controleur)
+            ajoutees.append(identifiant)
+        return ajoutees
+
+    def ajouter_carte(self, identifiant: str, controleur: RelayController):
+        self.cartes[identifiant] = controleur
+
+    def carte_principale(self) -> RelayController:
+        """Première carte découverte, utilisée par l'installation à un seul poêle."""
+        if not self.cartes:
+            raise Exception("Aucun CH340 trouvé. Vérifiez la connexion USB.")
+        return next(iter(self.cartes.values()))
+
+    def affecter(self, poele: str, nom: str, carte: str, canal: int):
+        if carte not in self.cartes:
+            raise KeyError(f"Carte inconnue: {carte}")
+        if not 1 <= canal <= self.cartes[carte].num_relays:
+            raise ValueError(f"Canal {canal} invalide pour la carte {carte}")
+        self.sorties[(poele, nom)] = Sortie(carte, canal)
+
+    def affecter_poele(self, poele: str, carte: str, canaux: Dict[str, int] = CANAUX_POELE):
+        """Affecte toutes les sorties d'un poêle à une carte avec le câblage standard."""
+        for nom, canal in canaux.items():
+            self.affecter(poele, nom, carte, canal)
+
+    def charger_affectations(self, fichier: str):
+        """
+        Charge les affectations depuis un fichier JSON de la forme
+        {"salon": {"moteur_fumee": ["usb-1-1.2:1.0", 1], ...}, ...}
+        """
+        if not os.path.exists(fichier):
+            return
+        with open(fichier, 'r') as f:
+            for poele, sorties in json.load(f).items():
+                for nom, (carte, canal) in sorties.items():
+                    self.affecter(poele, nom, carte, canal)
+
+    def sortie(self, poele: str, nom: str) -> Sortie:
+        return self.sorties[(poele, nom)]
+
+    def commander(self, poele: str, nom: str, etat: RelayState,
+                  priorite: PrioriteCommande = PrioriteCommande.CONTROLE):
+        """Commande une sortie logique ; ne bloque pas (la commande est mise en file de sa carte)."""
+        sortie = self.sorties[(poele, nom)]
+        return self.cartes[sortie.carte].definir_relais(sortie.canal, etat, priorite)
+
+    def etat(self, poele: str, nom: str) -> RelayState:
+        sortie = self.sorties[(poele, nom)]
+        return self.cartes[sortie.carte].states[sortie.canal - 1]
+
+    def cleanup(self):
+        for controleur in self.cartes.values():
+            controleur.cleanup()
+
+
+class CablagePoele:
+    """
+    Un poêle du registre vu comme un RelayController câblé en standard (numéros de CANAUX_POELE).
+
+    Le séquenceur, le chien de garde et la comptabilité continuent d'utiliser les canaux 1/3/4/7/8 ;
+    chaque appel est redirigé vers la carte et le canal affectés à la sortie dans le registre.
+    """
+
+    def __init__(self, registre: RegistreCartes, poele: str, canaux: Dict[str, int] = CANAUX_POELE):
+        self.registre = registre
+        self.poele = poele
+        self.noms = {canal: nom for nom, canal in canaux.items()}
+        self.num_relays = max(canaux.values())
+
+    def _cible(self, canal: int) -> Tuple[RelayController, int]:
+        sortie = self.registre.sortie(self.poele, self.noms[canal])
+        return self.registre.cartes[sortie.carte], sortie.canal
+
+    @property
+    def states(self) -> List[RelayState]:
+        """États connus, indexés par canal standard - 1 (OFF pour les canaux non câblés)."""
+        etats = [RelayState.OFF] * self.num_relays
+        for canal in self.noms:
+            carte, canal_carte = self._cible(canal)
+            etats[canal - 1] = carte.states[canal_carte - 1]
+        return etats
+
+    @property
+    def entrees(self) -> Dict[int, EntreeNumerique]:
+        """Entrées des cartes par canal standard ; leurs abonnés reçoivent le canal de la carte."""
+        entrees = {}
+        for canal in self.noms:
+            carte, canal_carte = self._cible(canal)
+            if canal_carte in carte.entrees:
+                entrees[canal] = carte.entrees[canal_carte]
+        return entrees
+
+    def definir_relais(self, relay_num: int, state: RelayState,
+                       priorite: PrioriteCommande = PrioriteCommande.CONTROLE) -> threading.Event:
+        carte, canal_carte = self._cible(relay_num)
+        return carte.definir_relais(canal_carte, state, priorite)
+
+    def forcer_relais(self, relay_num: int, state: RelayState) -> threading.Event:
+        carte, canal_carte = self._cible(relay_num)
+        return carte.forcer_relais(canal_carte, state)
+
+    def demander_etat(self, relay_num: int):
+        carte, canal_carte = self._cible(relay_num)
+        carte.demander_etat(canal_carte)
+
+    def abonner_transitions(self, rappel: Callable[[int, RelayState], None]):
+        """`rappel(canal standard, etat)` pour les transitions des sorties de ce poêle, quelle que soit la carte."""
+        for identifiant, carte in self.registre.cartes.items():
+            def traduire(canal_carte: int, etat: RelayState, identifiant=identifiant):
+                for canal, nom in self.noms.items():
+                    if self.registre.sortie(self.poele, nom) == Sortie(identifiant, canal_carte):
+                        rappel(canal, etat)
+            carte.abonner_transitions(traduire)
+
+
+if __name__ == "__main__":
+    # Montée en charge : 1, 4 et 16 cartes simulées, dont une carte lente
+    import time
+    from Simulateur import PortSimule
+
+    class PortLent(PortSimule):
+        """Port dont chaque écriture prend `duree_ecriture` secondes (USB saturé, adaptateur défaillant...)."""
+
+        def __init__(self, duree_ecriture: float, **options):
+            super().__init__(**options)
+            self.duree_ecriture = duree_ecriture
+
+        def write(self, donnees: bytes) -> int:
+            time.sleep(self.duree_ecriture)
+            return super().write(donnees)
+
+    commandes_par_carte = 50
+    for nombre in (1, 4, 16):
+        registre = RegistreCartes()
+        for i in range(nombre):
+            # La dernière carte est dix fois plus lente que les autres
+            duree = 0.02 if i == nombre - 1 and nombre > 1 else 0.002
+            registre.ajouter_carte(f"carte{i}", RelayController(serial_port=PortLent(duree), espacement=0.0,
+                                                                carte=f"carte{i}"))
+            registre.affecter_poele(f"poele{i}", f"carte{i}")
+
+        debut = time.perf_counter()
+        for n in range(commandes_par_carte):
+            for i in range(nombre):
+                registre.commander(f"poele{i}", 'vis_pellet', RelayState.ON if n % 2 else RelayState.OFF)
+        fins = {}
+        for i in range(nombre):
+            registre.cartes[f"carte{i}"].ordonnanceur.attendre_vidage()
+            fins[i] = time.perf_counter() - debut
+        registre.cleanup()
+
+        normales = [fins[i] for i in range(nombre - 1)] if nombre > 1 else [fins[0]]
+        debit = len(normales) * commandes_par_carte / max(normales)
+        ligne = f"{nombre:2d} cartes : cartes normales {debit:5.0f} cmd/s (terminées en {max(normales):.2f} s)"
+        if nombre > 1:
+            ligne += f", carte lente terminée en {fins[nombre - 1]:.2f} s"
+        print(ligne)
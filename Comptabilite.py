@@ -0,0 +1,288 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple
+from CH340 import RelayState
+from Metriques import REGISTRE
+
+RELAIS_VIS_PELLET = 3
+MOIS_DEBUT_SAISON = 9  # Une saison de chauffe va du 1er septembre au 31 août
+JOURS_CONSERVES = 400
+CHAMPS = ('vis_secondes', 'pellets_grammes', 'bruleur_secondes', 'allumages', 'echecs')
+
+PELLETS_JOUR = REGISTRE.jauge('comptabilite_pellets_jour_grammes', "Pellets consommés aujourd'hui")
+PELLETS_SAISON = REGISTRE.jauge('comptabilite_pellets_saison_grammes', "Pellets consommés depuis le début de la saison")
+HEURES_BRULEUR = REGISTRE.jauge('comptabilite_bruleur_heures', "Heures de flamme cumulées")
+ALLUMAGES = REGISTRE.jauge('comptabilite_allumages', "Démarrages cumulés")
+TREMIE = REGISTRE.jauge('comptabilite_tremie_grammes', "Estimation des pellets restant dans la trémie")
+CYCLES_VIS = REGISTRE.jauge('comptabilite_cycles_vis', "Mises en marche cumulées du relais de la vis")
+
+
+def cles_periodes(instant: float) -> Tuple[str, str, str]:
+    """Clés du jour, du mois et de la saison contenant `instant` (epoch)."""
+    date = datetime.fromtimestamp(instant)
+    saison = date.year if date.month >= MOIS_DEBUT_SAISON else date.year - 1
+    return date.strftime('%Y-%m-%d'), date.strftime('%Y-%m'), f"{saison}-{saison + 1}"
+
+
+def bornes_jour(instant: float) -> Tuple[float, float]:
+    """Minuit précédent et minuit suivant `instant` (epoch, heure locale)."""
+    date = datetime.fromtimestamp(instant).date()
+    debut = datetime.combine(date, datetime.min.time())
+    return debut.timestamp(), (debut + timedelta(days=1)).timestamp()
+
+
+class Comptable:
+    """
+    Compteurs de fonctionnement tenus à jour à chaque transition, sans relire l'historique.
+
+    Alimenté par les transitions des relais (RelayController.abonner_transitions) et par les changements
+    d'état du poêle ; chaque événement met à jour en O(1) le total, le jour, le mois et la saison.
+    Les intervalles en cours (vis, flamme) sont reportés à chaque sauvegarde périodique : un arrêt
+    brutal ne perd au plus qu'une période.
+    """
+
+    def __init__(self, fichier: str = "comptabilite_poele.json", lire_debit: Callable[[], float] = lambda: 1.2,
+                 capacite_tremie: float = 15000.0, periode_sauvegarde: float = 60.0,
+                 horloge: Callable[[], float] = time.time):
+        self.fichier = fichier
+        self.lire_debit = lire_debit  # Grammes par seconde de vis
+        self.capacite_tremie = capacite_tremie
+        self.periode_sauvegarde = periode_sauvegarde
+        self.horloge = horloge
+        self.totaux: Dict[str, Dict[str, float]] = {}
+        self.cycles_relais: Dict[int, int] = {}
+        self.tremie_grammes = capacite_tremie
+        self.vis_depuis: Optional[float] = None
+        self.flamme_depuis: Optional[float] = None
+        self.jour_courant: Tuple[float, float, Tuple[str, ...]] = (0.0, 0.0, ())
+        self.verrou = threading.Lock()
+        self.reveil = threading.Event()
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+
+    # --- Événements ------------------------------------------------------
+
+    def transition_relais(self, canal: int, etat: RelayState):
+        """Abonné de RelayController : appelé par le thread d'écriture série."""
+        with self.verrou:
+            maintenant = self.horloge()
+            if etat == RelayState.ON:
+                self.cycles_relais[canal] = self.cycles_relais.get(canal, 0) + 1
+                if canal == RELAIS_VIS_PELLET and self.vis_depuis is None:
+                    self.vis_depuis = maintenant
+            elif canal == RELAIS_VIS_PELLET and self.vis_depuis is not None:
+                self._cloturer_vis(maintenant)
+                self.vis_depuis = None
+            self._publier_jauges(maintenant)
+
+    def flamme(self, presente: bool):
+        """Début ou fin de la combustion (phases de stabilisation et de modulation)."""
+        with self.verrou:
+            maintenant = self.horloge()
+            if presente and self.flamme_depuis is None:
+                self.flamme_depuis = maintenant
+            elif not presente and self.flamme_depuis is not None:
+                self._cumuler(self.flamme_depuis, maintenant, {'bruleur_secondes': 1.0})
+                self.flamme_depuis = None
+            self._publier_jauges(maintenant)
+
+    def demarrage(self):
+        self._compter('allumages')
+
+    def echec(self):
+        self._compter('echecs')
+
+    def remplir_tremie(self, grammes: Optional[float] = None):
+        """Trémie remplie (complètement si `grammes` n'est pas précisé)."""
+        with self.verrou:
+            self.tremie_grammes = self.capacite_tremie if grammes is None else min(
+                self.capacite_tremie, self.tremie_grammes + grammes)
+            self._publier_jauges(self.horloge())
+
+    # --- Accumulateurs ---------------------------------------------------
+
+    def _compter(self, champ: str):
+        with self.verrou:
+            maintenant = self.horloge()
+            self._ajouter(maintenant, {champ: 1})
+            self._publier_jauges(maintenant)
+
+    def _cloturer_vis(self, maintenant: float):
+        debit = self.lire_debit()
+        self._cumuler(self.vis_depuis, maintenant, {'vis_secondes': 1.0, 'pellets_grammes': debit})
+        self.tremie_grammes = max(0.0, self.tremie_grammes - max(0.0, maintenant - self.vis_depuis) * debit)
+
+    def _periodes(self, instant: float) -> Tuple[Tuple[str, ...], float]:
+        """Clés des totaux touchés par `instant` et minuit suivant ; recalculées une fois par jour."""
+        debut, fin, cles = self.jour_courant
+        if not debut <= instant < fin:
+            debut, fin = bornes_jour(instant)
+            cles = ('total',) + cles_periodes(instant)
+            self.jour_courant = (debut, fin, cles)
+        return cles, fin
+
+    def _cumuler(self, debut: float, fin: float, taux: Dict[str, float]):
+        """Répartit un intervalle sur les jours qu'il couvre (les mois et saisons changent à minuit)."""
+        while debut < fin:
+            tranche = min(fin, self._periodes(debut)[1])
+            self._ajouter(debut, {champ: (tranche - debut) * valeur for champ, valeur in taux.items()})
+            debut = tranche
+
+    def _ajouter(self, instant: float, valeurs: Dict[str, float]):
+        for cle in self._periodes(instant)[0]:
+            periode = self.totaux.get(cle)
+            if periode is None:
+                periode = self.totaux[cle] = dict.fromkeys(CHAMPS, 0)
+            for champ, valeur in valeurs.items():
+                periode[champ] += valeur
+
+    def _reporter(self, maintenant: float):
+        """Cumule les intervalles en cours jusqu'à `maintenant` et les rouvre."""
+        if self.vis_depuis is not None:
+            self._cloturer_vis(maintenant)
+            self.vis_depuis = maintenant
+        if self.flamme_depuis is not None:
+            self._cumuler(self.flamme_depuis, maintenant, {'bruleur_secondes': 1.0})
+            self.flamme_depuis = maintenant
+
+    def _publier_jauges(self, maintenant: float):
+        _, jour, _, saison = self._periodes(maintenant)[0]
+        vide = dict.fromkeys(CHAMPS, 0)
+        PELLETS_JOUR.definir(self.totaux.get(jour, vide)['pellets_grammes'])
+        PELLETS_SAISON.definir(self.totaux.get(saison, vide)['pellets_grammes'])
+        total = self.totaux.get('total', vide)
+        HEURES_BRULEUR.definir(total['bruleur_secondes'] / 3600.0)
+        ALLUMAGES.definir(total['allumages'])
+        TREMIE.definir(self.tremie_grammes)
+        CYCLES_VIS.definir(self.cycles_relais.get(RELAIS_VIS_PELLET, 0))
+
+    # --- Lecture ---------------------------------------------------------
+
+    def resume(self) -> dict:
+        """Totaux du jour, du mois, de la saison et depuis l'origine, à l'instant présent."""
+        with self.verrou:
+            maintenant = self.horloge()
+            self._reporter(maintenant)
+            self._publier_jauges(maintenant)
+            _, jour, mois, saison = self._periodes(maintenant)[0]
+            vide = dict.fromkeys(CHAMPS, 0)
+            periodes = {nom: dict(self.totaux.get(cle, vide))
+                        for nom, cle in (('jour', jour), ('mois', mois), ('saison', saison), ('total', 'total'))}
+            # Autonomie au rythme de consommation moyen de la saison
+            secondes = periodes['saison']['bruleur_secondes']
+            consommation = periodes['saison']['pellets_grammes'] / secondes if secondes else 0.0
+            return {
+                **periodes,
+                'cycles_relais': dict(self.cycles_relais),
+                'tremie_grammes': self.tremie_grammes,
+                'autonomie_heures': self.tremie_grammes / consommation / 3600.0 if consommation else None,
+            }
+
+    # --- Persistance -----------------------------------------------------
+
+    def charger(self):
+        """Reprend les compteurs du dernier point de sauvegarde (ValueError si le fichier est illisible)."""
+        if not os.path.exists(self.fichier):
+            return
+        with open(self.fichier, 'r') as f:
+            donnees = json.load(f)
+        with self.verrou:
+            self.totaux = {cle: {champ: periode.get(champ, 0) for champ in CHAMPS}
+                           for cle, periode in donnees['totaux'].items()}
+            self.cycles_relais = {int(canal): cycles for canal, cycles in donnees['cycles_relais'].items()}
+            self.tremie_grammes = float(donnees['tremie_grammes'])
+            self._publier_jauges(self.horloge())
+
+    def sauvegarder(self):
+        """Point de sauvegarde : fichier temporaire synchronisé sur disque puis renommage atomique."""
+        with self.verrou:
+            maintenant = self.horloge()
+            self._reporter(maintenant)
+            limite = datetime.fromtimestamp(maintenant - JOURS_CONSERVES * 86400).strftime('%Y-%m-%d')
+            for cle in [cle for cle in self.totaux if len(cle) == 10 and cle < limite]:
+                del self.totaux[cle]
+            contenu = json.dumps({
+                'totaux': self.totaux,
+                'cycles_relais': self.cycles_relais,
+                'tremie_grammes': self.tremie_grammes,
+                'horodatage': maintenant,
+            })
+        fichier_temporaire = self.fichier + ".tmp"
+        with open(fichier_temporaire, 'w') as f:
+            f.write(contenu)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(fichier_temporaire, self.fichier)
+        # Le renommage lui-même doit atteindre le disque
+        dossier = os.open(os.path.dirname(os.path.abspath(self.fichier)), os.O_RDONLY)
+        try:
+            os.fsync(dossier)
+        finally:
+            os.close(dossier)
+
+    def demarrer(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._executer, name='comptabilite', daemon=True)
+        self.thread.start()
+
+    def _executer(self):
+        while self.running:
+            self.reveil.wait(self.periode_sauvegarde)
+            try:
+                self.sauvegarder()
+            except OSError:
+                pass  # Nouvelle tentative à la période suivante
+
+    def arreter(self):
+        """Arrête le thread puis écrit un dernier point de sauvegarde."""
+        self.running = False
+        self.reveil.set()
+        if self.thread is not None:
+            self.thread.join(timeout=2.0)
+        self.sauvegarder()
+
+
+if __name__ == "__main__":
+    # Coût d'un événement, d'une lecture et d'un point de sauvegarde, puis reprise après arrêt brutal
+    import tempfile
+    import timeit
+
+    fichier = os.path.join(tempfile.mkdtemp(), "comptabilite.json")
+    horloge = [datetime(2026, 1, 1).timestamp()]
+    comptable = Comptable(fichier, horloge=lambda: horloge[0])
+    comptable.demarrage()
+    comptable.flamme(True)
+
+    def cycle_vis():
+        horloge[0] += 2.0
+        comptable.transition_relais(RELAIS_VIS_PELLET, RelayState.ON)
+        horloge[0] += 4.0
+        comptable.transition_relais(RELAIS_VIS_PELLET, RelayState.OFF)
+
+    n = 100_000  # Environ une semaine de modulation
+    duree = timeit.timeit(cycle_vis, number=n)
+    print(f"Transition de relais : {duree / (2 * n) * 1e6:.2f} µs")
+    duree = timeit.timeit(comptable.resume, number=10_000)
+    print(f"Lecture des totaux   : {duree / 10_000 * 1e6:.2f} µs")
+    duree = timeit.timeit(comptable.sauvegarder, number=20)
+    print(f"Point de sauvegarde  : {duree / 20 * 1000:.2f} ms (fsync compris)")
+
+    resume = comptable.resume()
+    print(f"Total : vis {resume['total']['vis_secondes'] / 3600:.1f} h, {resume['total']['pellets_grammes'] / 1000:.1f} kg, "
+          f"flamme {resume['total']['bruleur_secondes'] / 3600:.1f} h, {len(comptable.totaux) - 1} périodes, "
+          f"trémie {resume['tremie_grammes']:.0f} g")
+    attendu = 2 * n * 1.0 * 1.2 * 2  # 2 s de vis par cycle
+    assert abs(resume['total']['pellets_grammes'] - attendu) < 1e-3 * attendu
+    jours = [cle for cle in comptable.totaux if len(cle) == 10]
+    assert abs(sum(comptable.totaux[j]['bruleur_secondes'] for j in jours)
+               - resume['total']['bruleur_secondes']) < 1e-6
+
+    # Arrêt brutal : la copie rechargée correspond au dernier point de sauvegarde
+    comptable.sauvegarder()
+    reprise = Comptable(fichier, horloge=lambda: horloge[0])
+    reprise.charger()
+    assert reprise.totaux == comptable.totaux and reprise.cycles_relais == comptable.cycles_relais
+    print("Reprise depuis le point de sauvegarde : OK")
@@ -1,11 +1,37 @@
-import RPi.GPIO as GPIO
 import time
+from typing import List, Optional, Tuple
+from Metriques import REGISTRE
+
+try:
+    import RPi.GPIO as GPIO
+except ImportError:
+    GPIO = None  # Hors Raspberry Pi : seul le décodage est utilisable (rejeu de sessions)
+
+DISPONIBLE = GPIO is not None
 
 # Configuration du capteur
 DHT_PIN = 4  # Broche GPIO où le capteur DHT11 est connecté
 
-def read_dht11():
+DUREE_LECTURE = REGISTRE.histogramme('dht11_lecture_secondes', 'Durée d\'une lecture du DHT11')
+LECTURES = REGISTRE.compteur('dht11_lectures_total', 'Lectures du DHT11')
+ECHECS = REGISTRE.compteur('dht11_echecs_total', 'Lectures du DHT11 sans données exploitables')
+
+
+def read_dht11(enregistreur=None):
     # Lecture des donnée du capteur DHT11
+    LECTURES.incrementer()
+    with DUREE_LECTURE.chronometrer():
+        data = _lire_echantillons()
+        if enregistreur is not None:
+            enregistreur.dht11(data)
+        humidity, temperature = decoder_echantillons(data)
+    if humidity is None:
+        ECHECS.incrementer()
+    return humidity, temperature
+
+
+def _lire_echantillons() -> List[int]:
+    """Envoie le signal de démarrage et échantillonne la broche de données."""
     data = []
     GPIO.setmode(GPIO.BCM)
     GPIO.setup(DHT_PIN, GPIO.OUT)
@@ -20,6 +46,12 @@ def read_dht11():
     for _ in range(500):
         data.append(GPIO.input(DHT_PIN))
 
+    GPIO.cleanup()
+    return data
+
+
+def decoder_echantillons(data: List[int]) -> Tuple[Optional[int], Optional[int]]:
+    """Décode les échantillons bruts de la broche en (humidité, température)."""
     # Analyse des données
     bits = []
     count = 0
@@ -32,9 +64,7 @@ def read_dht11():
 
     # Groupes de 8 bits (5 octets : humidité, température, checksum)
     if len(bits) < 40:
-        print("Erreur : Données insuffisantes.")
-        GPIO.cleanup()
-        return None, None
+        return None, None  # Données insuffisantes (comptées dans dht11_echecs_total)
 
     humidity_bits = bits[0:8]
     temperature_bits = bits[16:24]
@@ -43,7 +73,6 @@ def read_dht11():
     humidity = sum([humidity_bits[i] * 2 ** (7 - i) for i in range(8)])
     temperature = sum([temperature_bits[i] * 2 ** (7 - i) for i in range(8)])
 
-    GPIO.cleanup()
     return humidity, temperature
 
 
@@ -0,0 +1,229 @@
+import os
+import struct
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from DHT11 import decoder_echantillons
+
+# Format d'une session :
+#   en-tête  : MAGIC, version, heure de début (epoch)            '<4sBd'
+#   record   : type, instant en µs depuis le début, longueur      '<BQH' + données
+# Les données d'un record série commencent par l'identifiant de la carte (longueur '<B' puis UTF-8, vide pour
+# un contrôleur sans identifiant) : une session couvre toutes les cartes du processus.
+MAGIC = b'PSES'
+VERSION = 2
+FORMAT_ENTETE = '<4sBd'
+FORMAT_RECORD = '<BQH'
+TAILLE_ENTETE = struct.calcsize(FORMAT_ENTETE)
+TAILLE_RECORD = struct.calcsize(FORMAT_RECORD)
+
+SERIE_TX = 1     # Octets écrits vers le CH340
+SERIE_RX = 2     # Ligne reçue du CH340
+DHT11_BRUT = 3   # Échantillons bruts de la broche DHT11 (bits compactés)
+COMMANDE = 4     # Commande utilisateur (texte UTF-8)
+TELEMETRIE = 5   # Mesures de la boucle de contrôle (voir FORMAT_TELEMETRIE)
+
+# Température ambiante, température des fumées, part de marche de la vis (0-1), vitesse moteur fumée ;
+# NaN pour un capteur encore jamais mesuré
+FORMAT_TELEMETRIE = '<4f'
+
+
+def compacter_echantillons(echantillons: Sequence[int]) -> bytes:
+    """Compacte une suite d'échantillons 0/1 : nombre d'échantillons puis un bit par échantillon."""
+    octets = bytearray((len(echantillons) + 7) // 8)
+    for i, niveau in enumerate(echantillons):
+        if niveau:
+            octets[i >> 3] |= 0x80 >> (i & 7)
+    return struct.pack('<H', len(echantillons)) + bytes(octets)
+
+
+def decompacter_echantillons(donnees: bytes) -> List[int]:
+    (nombre,) = struct.unpack_from('<H', donnees)
+    octets = donnees[2:]
+    return [(octets[i >> 3] >> (7 - (i & 7))) & 1 for i in range(nombre)]
+
+
+def etiqueter_carte(carte: Optional[str], donnees: bytes) -> bytes:
+    identifiant = (carte or '').encode('utf-8')
+    return struct.pack('<B', len(identifiant)) + identifiant + donnees
+
+
+def separer_carte(donnees: bytes) -> Tuple[Optional[str], bytes]:
+    """Inverse de etiqueter_carte : (identifiant de la carte ou None, octets série)."""
+    longueur = donnees[0]
+    return donnees[1:1 + longueur].decode('utf-8') or None, donnees[1 + longueur:]
+
+
+class Enregistreur:
+    """Enregistre les flux série, les captures DHT11 et les commandes dans un fichier de session."""
+
+    def __init__(self, chemin: str):
+        self.chemin = chemin
+        self.fichier: BinaryIO = open(chemin, 'wb')
+        self.debut = time.monotonic_ns()
+        self.verrou = threading.Lock()
+        self.fichier.write(struct.pack(FORMAT_ENTETE, MAGIC, VERSION, time.time()))
+
+    @classmethod
+    def depuis_environnement(cls, variable: str = 'POELE_ENREGISTREMENT') -> Optional['Enregistreur']:
+        """Crée un enregistreur si la variable d'environnement indique un fichier de session."""
+        chemin = os.environ.get(variable)
+        return cls(chemin) if chemin else None
+
+    def _ecrire(self, type_record: int, donnees: bytes):
+        instant_us = (time.monotonic_ns() - self.debut) // 1000
+        with self.verrou:
+            if not self.fichier.closed:
+                self.fichier.write(struct.pack(FORMAT_RECORD, type_record, instant_us, len(donnees)) + donnees)
+
+    def serie_tx(self, donnees: bytes, carte: Optional[str] = None):
+        self._ecrire(SERIE_TX, etiqueter_carte(carte, donnees))
+
+    def serie_rx(self, donnees: bytes, carte: Optional[str] = None):
+        self._ecrire(SERIE_RX, etiqueter_carte(carte, donnees))
+
+    def dht11(self, echantillons: Sequence[int]):
+        self._ecrire(DHT11_BRUT, compacter_echantillons(echantillons))
+
+    def commande(self, texte: str):
+        self._ecrire(COMMANDE, texte.encode('utf-8'))
+
+    def telemetrie(self, ambiante: float, fumee: float, duty_vis: float, vitesse_moteur: float):
+        self._ecrire(TELEMETRIE, struct.pack(FORMAT_TELEMETRIE, ambiante, fumee, duty_vis, vitesse_moteur))
+
+    def fermer(self):
+        with self.verrou:
+            self.fichier.close()
+
+
+def lire_session(chemin: str) -> Iterator[Tuple[int, float, bytes]]:
+    """Itère sur les records d'une session : (type, instant en secondes, données)."""
+    with open(chemin, 'rb') as f:
+        magic, version, _ = struct.unpack(FORMAT_ENTETE, f.read(TAILLE_ENTETE))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{chemin} n'est pas une session de version {VERSION}")
+        while True:
+            entete = f.read(TAILLE_RECORD)
+            if len(entete) < TAILLE_RECORD:
+                return  # Fin de fichier (ou dernier record tronqué par un arrêt brutal)
+            type_record, instant_us, longueur = struct.unpack(FORMAT_RECORD, entete)
+            donnees = f.read(longueur)
+            if len(donnees) < longueur:
+                return
+            yield type_record, instant_us / 1e6, donnees
+
+
+@dataclass
+class BilanRejeu:
+    records: int = 0
+    duree_session: float = 0.0
+    duree_rejeu: float = 0.0
+    lectures_dht11: int = 0
+    commandes: int = 0
+    divergences: List[str] = field(default_factory=list)
+
+
+def rejouer(
+    chemin: str,
+    controleur,
+    vitesse: Optional[float] = 1.0,
+    sur_capteur: Optional[Callable[[Optional[int], Optional[int]], None]] = None,
+    sur_commande: Optional[Callable[[str], None]] = None,
+) -> BilanRejeu:
+    """
+    Rejoue une session dans un RelayController dont le port est un PortSimule sans écho, ou dans un
+    dictionnaire {identifiant de carte: RelayController} pour une session couvrant plusieurs cartes.
+    Avec un seul contrôleur, le trafic de toutes les cartes lui est adressé ; avec un dictionnaire,
+    le trafic d'une carte absente est ignoré et signalé dans les divergences.
+
+    `vitesse` : 1.0 = temps réel, 10.0 = dix fois plus vite, None = aussi vite que possible.
+    Les lignes reçues sont passées au traitement des messages du contrôleur et les captures DHT11
+    au décodeur, puis à `sur_capteur`. Si `sur_commande` est fourni, les commandes utilisateur sont
+    rejouées et les octets écrits comparés à ceux de la session ; sinon les octets enregistrés
+    sont réémis tels quels.
+
+    L'anti-rebond des entrées suit l'horloge de la session et non celle du rejeu : les lignes
+    reçues sont datées de leur instant enregistré, quelle que soit la vitesse.
+    """
+    controleurs: Dict[Optional[str], object] = controleur if isinstance(controleur, dict) else {None: controleur}
+    bilan = BilanRejeu()
+    attendus: Dict[Optional[str], List[bytes]] = {carte: [] for carte in controleurs}
+    ecritures_initiales = {carte: len(c.serial_port.ecritures) for carte, c in controleurs.items()}
+    absentes = set()
+    debut = time.monotonic()
+    origine = time.perf_counter()  # Instants de session rapportés sur l'horloge des entrées
+
+    for type_record, instant, donnees in lire_session(chemin):
+        if vitesse:
+            retard = debut + instant / vitesse - time.monotonic()
+            if retard > 0:
+                time.sleep(retard)
+        bilan.records += 1
+        bilan.duree_session = instant
+        arrivee = origine + instant
+        # Comme le thread de lecture entre deux lignes : confirme les entrées stables jusqu'à cet instant
+        for cible in controleurs.values():
+            for entree in cible.entrees.values():
+                entree.echeance(arrivee)
+
+        if type_record in (SERIE_RX, SERIE_TX):
+            carte, donnees = separer_carte(donnees)
+            if None in controleurs:
+                carte = None
+            elif carte not in controleurs:
+                absentes.add(carte)
+                continue
+            cible = controleurs[carte]
+            if type_record == SERIE_RX:
+                cible._process_message(donnees, arrivee)
+            elif sur_commande is None:
+                cible.serial_port.write(donnees)
+            else:
+                attendus[carte].append(donnees)
+        elif type_record == DHT11_BRUT:
+            bilan.lectures_dht11 += 1
+            humidite, temperature = decoder_echantillons(decompacter_echantillons(donnees))
+            if sur_capteur is not None:
+                sur_capteur(humidite, temperature)
+        elif type_record == COMMANDE:
+            bilan.commandes += 1
+            if sur_commande is not None:
+                sur_commande(donnees.decode('utf-8'))
+
+    # Les derniers changements d'entrée de la session sont confirmés comme ils l'auraient été en direct
+    for cible in controleurs.values():
+        for entree in cible.entrees.values():
+            entree.echeance(origine + bilan.duree_session + entree.anti_rebond)
+    bilan.duree_rejeu = time.monotonic() - debut
+    for carte in sorted(absentes, key=str):
+        bilan.divergences.append(f"trafic de la carte {carte} ignoré : carte absente du rejeu")
+    if sur_commande is not None:
+        for carte, cible in controleurs.items():
+            cible.ordonnanceur.attendre_vidage()
+            obtenues = cible.serial_port.ecritures[ecritures_initiales[carte]:]
+            if obtenues != attendus[carte]:
+                de_la_carte = '' if carte is None else f" (carte {carte})"
+                bilan.divergences.append(
+                    f"écritures série attendues {attendus[carte]}, obtenues {obtenues}{de_la_carte}")
+    return bilan
+
+
+if __name__ == "__main__":
+    import argparse
+    from CH340 import RelayController
+    from Simulateur import PortSimule
+
+    parser = argparse.ArgumentParser(description="Rejoue une session enregistrée dans un contrôleur simulé")
+    parser.add_argument('session')
+    parser.add_argument('--vitesse', type=float, default=0.0, help="facteur de vitesse (0 = maximum)")
+    args = parser.parse_args()
+
+    controleur = RelayController(serial_port=PortSimule(echo=False), espacement=0.0)
+    try:
+        bilan = rejouer(args.session, controleur, vitesse=args.vitesse or None)
+    finally:
+        controleur.cleanup()
+    print(f"{bilan.records} records, {bilan.lectures_dht11} lectures DHT11, {bilan.commandes} commandes")
+    print(f"Session de {bilan.duree_session:.1f} s rejouée en {bilan.duree_rejeu:.3f} s")
+    print(f"États finaux des relais : {[str(etat) for etat in controleur.states]}")
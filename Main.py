@@ -1,11 +1,61 @@
 import json
+import math
 import os
 import curses
 import logging
-from typing import Dict, List
-from CH340 import RelayController, RelayState
-
-CH340 = RelayController()
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional
+from CH340 import RelayState
+from Cartes import CablagePoele, RegistreCartes
+from Comptabilite import Comptable
+import DHT11
+from Enregistrement import Enregistreur
+from Metriques import REGISTRE, ServeurMetriques
+from Programmation import LIMITES_CONSIGNE, Planificateur, Programmation
+from Securite import ChienDeGarde
+from Sequenceur import PHASES_ECHEC, ParametresSequence, Phase, Sequenceur
+import SondeFumee
+from Surveillance_config import SurveillanceFichier
+from Tendances import Tendances, sparkline
+from Traces import TRACEUR
+
+ENREGISTREUR = Enregistreur.depuis_environnement()  # POELE_ENREGISTREMENT=session.bin
+
+# Toutes les cartes CH340 branchées ; ce poêle utilise la première avec le câblage standard,
+# sauf affectation différente dans cartes_poele.json
+CARTES = RegistreCartes()
+CARTES.decouvrir()
+CARTES.carte_principale()  # Erreur explicite si aucun CH340 n'est branché
+for carte in CARTES.cartes.values():  # Le trafic de toutes les cartes va dans la session, étiqueté par carte
+    carte.enregistreur = ENREGISTREUR
+CARTES.affecter_poele("poele", next(iter(CARTES.cartes)))
+CARTES.charger_affectations("cartes_poele.json")
+POELE = CablagePoele(CARTES, "poele")  # Sorties du poêle, routées vers leurs cartes
+
+DUREE_ECRITURE_LOG = REGISTRE.histogramme('historique_ecriture_secondes', "Durée d'écriture d'un événement")
+DUREE_IMAGE = REGISTRE.histogramme('interface_image_secondes', "Durée de dessin d'un écran de l'interface")
+DUREE_TENDANCES = REGISTRE.histogramme('interface_tendances_secondes', "Durée de dessin de l'écran des tendances")
+
+# Au-delà, la dernière mesure de la sonde des fumées n'est plus utilisée par le séquenceur
+MESURE_FUMEE_PERIMEE = 10.0
+
+# Capteurs suivis par l'écran des tendances
+CAPTEURS_TENDANCES = ('Température externe', 'Humidite externe', 'Température fumée', 'Vitesse moteur fumée')
+
+# Plages de valeurs acceptées pour les paramètres réglables
+LIMITES_PARAMETRES = {
+    'temperature_cible': LIMITES_CONSIGNE,
+    'vitesse_moteur_max': (1000.0, 2000.0),
+    'seuil_temperature_fumee': (100.0, 300.0),
+    'debit_vis': (0.1, 10.0),
+    'pid_kp': (0.0, 2.0),
+    'pid_ki': (0.0, 0.05),
+    'pid_kd': (0.0, 500.0),
+}
 
 
 class Historique:
@@ -27,7 +77,8 @@ class Historique:
 
     def ajouter_evenement(self, type_event: str, details: str):
         """Ajoute un événement dans l'historique"""
-        self.logger.info(f"{type_event}: {details}")
+        with DUREE_ECRITURE_LOG.chronometrer(), TRACEUR.span('historique.ecriture'):
+            self.logger.info(f"{type_event}: {details}")
 
     def obtenir_historique(self, nb_lignes: int = 10) -> List[str]:
         """Récupère les dernières lignes de l'historique"""
@@ -39,6 +90,14 @@ class Historique:
             return lignes[-nb_lignes:]
 
 
+@dataclass(frozen=True)
+class InstantaneConfiguration:
+    """Copie immuable de la configuration, publiée par simple affectation (sans verrou)."""
+    parametres: Mapping
+    source: str  # 'demarrage', 'interface' ou 'fichier'
+    horodatage_ns: int  # time.time_ns() de l'enregistrement à l'origine de l'instantané
+
+
 class ConfigurationPoele:
     def __init__(self, fichier_config: str = "config_poele.json"):
         self.fichier_config = fichier_config
@@ -47,9 +106,70 @@ class ConfigurationPoele:
             'temperature_cible': 22.0,
             'vitesse_moteur_max': 2000.0,
             'seuil_temperature_fumee': 200.0,
+            'debit_vis': 1.2,  # Grammes de pellets par seconde de vis, à étalonner
+            # Gains de la modulation, calculés hors ligne par Reglage_PID.py
+            'pid_kp': 0.15,
+            'pid_ki': 0.0,
+            'pid_kd': 0.0,
             'etat': False  # Ajout de l'état du poêle
         }
+        self.ecritures_en_attente = deque(maxlen=8)  # Nos écritures que la surveillance n'a pas encore vues
         self.parametres = self.charger_configuration()
+        self.instantane = self._publier(self.parametres, 'demarrage', time.time_ns())
+
+    @staticmethod
+    def _publier(config: dict, source: str, horodatage_ns: int) -> InstantaneConfiguration:
+        """Crée un instantané immuable de la configuration."""
+        return InstantaneConfiguration(MappingProxyType(dict(config)), source, horodatage_ns)
+
+    def valider_configuration(self, config) -> Optional[str]:
+        """Retourne un message d'erreur si la configuration est invalide, None sinon."""
+        if not isinstance(config, dict):
+            return "la configuration doit être un objet JSON"
+        for param, (minimum, maximum) in LIMITES_PARAMETRES.items():
+            valeur = config.get(param, self.config_defaut[param])
+            if isinstance(valeur, bool) or not isinstance(valeur, (int, float)):
+                return f"{param} doit être un nombre"
+            if not minimum <= valeur <= maximum:
+                return f"{param} doit être entre {minimum} et {maximum}"
+        if not isinstance(config.get('etat', False), bool):
+            return "etat doit être true ou false"
+        return None
+
+    def recharger_configuration(self, fichier: str):
+        """
+        Appelé par la surveillance inotify quand le fichier est modifié de l'extérieur.
+        Publie un nouvel instantané si la configuration est valide, sinon restaure la précédente.
+        """
+        try:
+            horodatage_ns = os.stat(fichier).st_mtime_ns
+            with open(fichier, 'r') as f:
+                contenu = f.read()
+            if contenu in self.ecritures_en_attente:
+                # Notre propre écriture : elle et les précédentes, remplacées depuis, ne sont plus attendues.
+                # Un retour manuel à un contenu déjà écrit par le programme reste donc pris en compte.
+                while contenu in self.ecritures_en_attente:
+                    self.ecritures_en_attente.popleft()
+                return
+            config = json.loads(contenu)
+            erreur = self.valider_configuration(config)
+        except Exception as e:
+            config, horodatage_ns, erreur = None, time.time_ns(), str(e)
+
+        precedent = self.instantane
+        if erreur is None:
+            for key in self.config_defaut:
+                config.setdefault(key, self.config_defaut[key])
+            if config == dict(precedent.parametres):
+                return  # Notre propre sauvegarde, ou aucun changement effectif
+            self.instantane = self._publier(config, 'fichier', horodatage_ns)
+            self.historique.ajouter_evenement("Configuration", "Modification externe détectée")
+            return
+
+        self.historique.ajouter_evenement(
+            "Erreur", f"Configuration externe invalide ({erreur}), restauration de la précédente"
+        )
+        self._ecrire_fichier(dict(precedent.parametres))
 
     def charger_configuration(self) -> dict:
         """Charge la configuration depuis le fichier JSON ou crée une configuration par défaut"""
@@ -70,17 +190,30 @@ class ConfigurationPoele:
         self.sauvegarder_configuration(self.config_defaut)
         return self.config_defaut.copy()
 
-    def sauvegarder_configuration(self, config: dict) -> bool:
-        """Sauvegarde la configuration dans le fichier JSON"""
+    def _ecrire_fichier(self, config: dict) -> bool:
+        """Écrit la configuration dans le fichier JSON"""
+        contenu = json.dumps(config, indent=4)
+        self.ecritures_en_attente.append(contenu)
         try:
-            with open(self.fichier_config, 'w') as f:
-                json.dump(config, f, indent=4)
-            self.historique.ajouter_evenement("Configuration", "Configuration sauvegardée")
+            # Écriture atomique : la surveillance ne doit jamais lire un fichier à moitié écrit
+            fichier_temporaire = self.fichier_config + ".tmp"
+            with open(fichier_temporaire, 'w') as f:
+                f.write(contenu)
+            os.replace(fichier_temporaire, self.fichier_config)
             return True
         except Exception as e:
             self.historique.ajouter_evenement("Erreur", f"Erreur de sauvegarde: {e}")
             return False
 
+    def sauvegarder_configuration(self, config: dict) -> bool:
+        """Sauvegarde la configuration dans le fichier JSON"""
+        with TRACEUR.span('config.sauvegarde'):
+            if not self._ecrire_fichier(config):
+                return False
+        self.instantane = self._publier(config, 'interface', time.time_ns())
+        self.historique.ajouter_evenement("Configuration", "Configuration sauvegardée")
+        return True
+
     def modifier_parametre(self, param: str, valeur: float) -> bool:
         """Modifie un paramètre et sauvegarde la configuration"""
         if param in self.parametres:
@@ -111,6 +244,7 @@ class Capteur:
     def __init__(self, nom: str, valeur_initiale: float):
         self.nom = nom
         self.valeur = valeur_initiale
+        self.horodatage: Optional[float] = None  # time.monotonic() de la dernière mesure, None = valeur initiale
 
     def lire_valeur(self) -> float:
         """Retourne la valeur actuelle du capteur."""
@@ -118,14 +252,18 @@ class Capteur:
 
     def mettre_a_jour(self, nouvelle_valeur: float):
         """Met à jour la valeur du capteur."""
+        if TRACEUR.attentes and nouvelle_valeur != self.valeur:
+            TRACEUR.fermer_attente('capteur.premier_changement', {'capteur': self.nom})
         self.valeur = nouvelle_valeur
+        self.horodatage = time.monotonic()
 
 
 class ControlePoele:
-    def __init__(self):
+    def __init__(self, periode_controle: float = 1.0, periode_dht11: float = 2.0):
         self.config = ConfigurationPoele()
         self.parametres = self.config.parametres
         self.en_marche = self.parametres.get('etat', False)
+        self.instantane_applique = self.config.instantane
         self.capteurs: Dict[str, Capteur] = {
             'Moteur fumée': Capteur('Moteur fumée', True),
             'Vitesse moteur fumée': Capteur('Vitesse moteur fumée', 1500.0),
@@ -138,6 +276,90 @@ class ControlePoele:
             'Etat_coupe_circuit': Capteur('Etat_coupe_circuit', False),
         }
 
+        for identifiant, erreur in CARTES.erreurs.items():
+            self.historique_erreur(f"Carte {identifiant} ignorée: {erreur}")
+
+        # Rechargement à chaud du fichier de configuration
+        self.surveillance = SurveillanceFichier(self.config.fichier_config, self.config.recharger_configuration)
+        try:
+            self.surveillance.demarrer()
+        except OSError as e:
+            self.historique_erreur(f"Surveillance de la configuration indisponible: {e}")
+
+        # Retours du coupe-circuit (relais 7) et du presostat (relais 8)
+        self.capteurs_entrees = {7: 'Etat_coupe_circuit', 8: 'Presosta'}
+        for canal, entree in POELE.entrees.items():
+            if canal in self.capteurs_entrees:
+                entree.abonner(
+                    lambda _canal, etat, arrivee, canal=canal: self._sur_changement_entree(canal, etat, arrivee))
+
+        # Chien de garde de sécurité (fumées, presostat, coupe-circuit)
+        self.chien_de_garde = ChienDeGarde(
+            self.capteurs, POELE,
+            lire_seuil_fumee=lambda: self.parametres['seuil_temperature_fumee'],
+            est_en_marche=lambda: self.en_marche,
+            sur_declenchement=self._sur_defaut_securite,
+        )
+        self.chien_de_garde.demarrer()
+
+        # Compteurs de fonctionnement (vis, flamme, démarrages, usure des relais), à côté de config_poele.json
+        self.comptable = Comptable(
+            os.path.join(os.path.dirname(os.path.abspath(self.config.fichier_config)), "comptabilite_poele.json"),
+            lire_debit=lambda: self.parametres['debit_vis'],
+        )
+        try:
+            self.comptable.charger()
+        except (ValueError, KeyError) as e:
+            self.historique_erreur(f"Comptabilité illisible, compteurs remis à zéro: {e}")
+        POELE.abonner_transitions(self.comptable.transition_relais)
+        self.comptable.demarrer()
+
+        # Sonde des fumées lue avant toute reprise : l'allumage est refusé sans mesure
+        if not SondeFumee.DISPONIBLE:
+            self.historique_erreur(
+                "Sonde des fumées introuvable (dtoverlay=w1-gpio,gpiopin=27), démarrage impossible")
+        self.lire_sonde_fumee()
+
+        # Séquences d'allumage et d'extinction (moteur fumée, vis, résistance)
+        self.sequenceur = Sequenceur(
+            POELE,
+            lire_fumee=self.lire_temperature_fumee,
+            lire_consigne=lambda: self.parametres['temperature_cible'],
+            lire_ambiante=lambda: self.mesure('Température externe'),
+            est_verrouille=lambda: self.chien_de_garde.verrouille,
+            sur_evenement=self.config.historique.ajouter_evenement,
+            sur_phase=self._sur_changement_phase,
+            parametres=self.parametres_sequence(),
+        )
+        self.sequenceur.demarrer()
+        if self.en_marche and not self.sequenceur.allumer():  # Reprise après redémarrage du programme
+            self.en_marche = False
+            self.config.modifier_etat(False)
+            self.historique_erreur("Reprise impossible: aucune mesure de température des fumées")
+
+        # Programmation hebdomadaire, stockée à côté de config_poele.json
+        self.fichier_programmation = os.path.join(
+            os.path.dirname(os.path.abspath(self.config.fichier_config)), "programmation_poele.json"
+        )
+        try:
+            programmation = Programmation.charger(self.fichier_programmation)
+        except (ValueError, KeyError) as e:
+            self.historique_erreur(f"Programmation invalide, ignorée: {e}")
+            programmation = Programmation()
+        self.refus_programmation: Optional[str] = None  # Dernier refus d'un démarrage programmé
+        self.planificateur = Planificateur(programmation, self.appliquer_programmation)
+        if not programmation.est_vide():
+            self.planificateur.demarrer()
+
+        # Démarrage de la boucle de contrôle
+        self.periode_controle = periode_controle
+        self.periode_dht11 = periode_dht11  # Le DHT11 ne supporte pas plus d'une lecture par seconde
+        self.derniere_lecture_dht11 = 0.0
+        self.tendances = Tendances(CAPTEURS_TENDANCES, periode_controle)
+        self.running = True
+        self.controle_thread = threading.Thread(target=self._boucle_controle, daemon=True)
+        self.controle_thread.start()
+
     # Relay 1 = Moteur fumée
     # Relay 2 = Moteur ventilation
     # Relay 3 = Moteur vis pellet
@@ -153,23 +375,209 @@ class ControlePoele:
     # Pin 30 = PWM Moteur fumée -> GND
     # Pin 32 = PWM Moteur fumée -> GPIO
 
+    def historique_erreur(self, details: str):
+        self.config.historique.ajouter_evenement("Erreur", details)
+
+    def _boucle_controle(self):
+        """Exécute un tick de contrôle à intervalle régulier."""
+        while self.running:
+            try:
+                self.rafraichir_configuration()
+                self.lire_sonde_fumee()
+                if DHT11.DISPONIBLE and time.monotonic() - self.derniere_lecture_dht11 >= self.periode_dht11:
+                    self.derniere_lecture_dht11 = time.monotonic()
+                    self.mettre_a_jour_dht11(*DHT11.read_dht11(ENREGISTREUR))
+                # Les valeurs initiales des capteurs jamais mesurés ne sont ni tracées ni enregistrées
+                self.tendances.echantillonner({nom: self.mesure(nom) for nom in CAPTEURS_TENDANCES})
+                if ENREGISTREUR is not None:
+                    ambiante, fumee, vitesse = (
+                        self.mesure(nom) for nom in ('Température externe', 'Température fumée', 'Vitesse moteur fumée')
+                    )
+                    ENREGISTREUR.telemetrie(
+                        math.nan if ambiante is None else ambiante,
+                        math.nan if fumee is None else fumee,
+                        self.sequenceur.duty_courant,
+                        math.nan if vitesse is None else vitesse,
+                    )
+            except Exception as e:
+                self.historique_erreur(f"Boucle de contrôle: {e}")
+            time.sleep(self.periode_controle)
+
+    def rafraichir_configuration(self):
+        """Applique le dernier instantané de configuration publié, s'il est nouveau."""
+        instantane = self.config.instantane
+        if instantane is self.instantane_applique:
+            return
+        self.instantane_applique = instantane
+        if instantane.source != 'fichier':
+            return  # Modification faite via l'interface, déjà appliquée
+
+        self.config.parametres = dict(instantane.parametres)
+        self.parametres = self.config.parametres
+        self.sequenceur.parametres = self.parametres_sequence()
+        latence_ms = (time.time_ns() - instantane.horodatage_ns) / 1e6
+        self.config.historique.ajouter_evenement(
+            "Configuration",
+            f"Rechargement appliqué (consigne {self.parametres['temperature_cible']}, "
+            f"{latence_ms:.0f} ms après l'enregistrement)"
+        )
+        if self.parametres['etat'] and not self.en_marche:
+            self.demarrer()
+        elif not self.parametres['etat'] and self.en_marche:
+            self.arreter()
+
+    def cleanup(self):
+        """Arrête la boucle de contrôle et la surveillance de la configuration."""
+        self.running = False
+        self.surveillance.arreter()
+        self.planificateur.arreter()
+        self.sequenceur.arreter()
+        self.comptable.arreter()
+        self.chien_de_garde.arreter()
+        self.controle_thread.join(timeout=self.periode_controle + 1.0)
+
+    def _sur_changement_entree(self, canal: int, etat: RelayState, arrivee: float):
+        """Appelé par le lecteur du port série quand une entrée change d'état (après anti-rebond)."""
+        nom = self.capteurs_entrees[canal]
+        self.capteurs[nom].mettre_a_jour(etat == RelayState.ON)
+        self.config.historique.ajouter_evenement("Entrée", f"{nom}: {etat}")
+
+    def _sur_changement_phase(self, phase: Phase):
+        """Appelé par le séquenceur à chaque changement de phase."""
+        self.comptable.flamme(phase in (Phase.STABILISATION, Phase.MODULATION))
+        if phase == Phase.PRE_VENTILATION:
+            self.comptable.demarrage()
+        elif phase in PHASES_ECHEC:
+            self.comptable.echec()
+
+    def _sur_defaut_securite(self, defaut: str):
+        """Appelé par le chien de garde après la mise en sécurité du poêle."""
+        self.en_marche = False
+        self.sequenceur.echouer(f"Mise en sécurité: {defaut}")
+        self.config.historique.ajouter_evenement("Sécurité", f"Mise en sécurité: {defaut}")
+        self.config.modifier_etat(False)
+
+    def acquitter_defaut(self) -> str:
+        if self.chien_de_garde.defaut is None:
+            if self.sequenceur.phase in PHASES_ECHEC:
+                if not self.sequenceur.acquitter():
+                    return "Fumées encore chaudes, extraction maintenue"
+                self.config.historique.ajouter_evenement("Séquence", "Échec acquitté")
+                return "Échec de séquence acquitté"
+            return "Aucun défaut de sécurité"
+        defaut = self.chien_de_garde.defaut
+        if not self.chien_de_garde.acquitter():
+            return f"Défaut toujours présent: {defaut}"
+        self.config.historique.ajouter_evenement("Sécurité", f"Défaut acquitté: {defaut}")
+        self.sequenceur.acquitter()
+        return "Défaut de sécurité acquitté"
+
+    def appliquer_programmation(self, consigne: Optional[float]) -> bool:
+        """
+        Appelé par le planificateur à chaque transition (None = arrêt programmé).
+        Retourne False si le démarrage est refusé : le planificateur retente alors périodiquement.
+        """
+        if self.refus_programmation is None:
+            self.config.historique.ajouter_evenement(
+                "Programmation", "Arrêt programmé" if consigne is None else f"Consigne programmée: {consigne}"
+            )
+        if consigne is None:
+            self.refus_programmation = None
+            if self.en_marche:
+                self.arreter()
+            return True
+        if self.parametres['temperature_cible'] != consigne:
+            self.modifier_parametre('temperature_cible', consigne)
+        if not self.en_marche:
+            message = self.demarrer()
+            if not self.en_marche:
+                if message != self.refus_programmation:  # Journalisé une fois par cause, pas à chaque essai
+                    self.config.historique.ajouter_evenement(
+                        "Programmation", f"Démarrage programmé refusé: {message}")
+                self.refus_programmation = message
+                return False
+        self.refus_programmation = None
+        return True
+
+    def lire_sonde_fumee(self):
+        """Met à jour la température des fumées depuis la sonde (une lecture en échec est ignorée)."""
+        if not SondeFumee.DISPONIBLE:
+            return
+        temperature = SondeFumee.lire_temperature()
+        if temperature is not None:
+            self.capteurs['Température fumée'].mettre_a_jour(temperature)
+
+    def mettre_a_jour_dht11(self, humidite: Optional[int], temperature: Optional[int]):
+        """Met à jour les capteurs externes à partir d'une lecture du DHT11 (réelle ou rejouée)."""
+        if humidite is None or temperature is None:
+            return
+        self.capteurs['Humidite externe'].mettre_a_jour(float(humidite))
+        self.capteurs['Température externe'].mettre_a_jour(float(temperature))
+
+    def executer_commande(self, commande: str) -> str:
+        """Exécute une commande utilisateur sous forme texte (utilisé par le rejeu de sessions)."""
+        mots = commande.split()
+        if mots == ['demarrer']:
+            return self.demarrer()
+        if mots == ['arreter']:
+            return self.arreter()
+        if len(mots) == 3 and mots[0] == 'parametre':
+            return self.modifier_parametre(mots[1], float(mots[2]))
+        return "Commande inconnue"
+
+    def parametres_sequence(self) -> ParametresSequence:
+        """Paramètres du séquenceur issus de la configuration (remplacés en bloc à chaque rechargement)."""
+        return ParametresSequence(
+            debit_vis=self.parametres['debit_vis'],
+            pid_kp=self.parametres['pid_kp'],
+            pid_ki=self.parametres['pid_ki'],
+            pid_kd=self.parametres['pid_kd'],
+        )
+
+    def mesure(self, nom: str) -> Optional[float]:
+        """Valeur d'un capteur, None tant qu'aucune mesure n'est arrivée (valeur initiale)."""
+        capteur = self.capteurs[nom]
+        return None if capteur.horodatage is None else capteur.lire_valeur()
+
+    def lire_temperature_fumee(self) -> Optional[float]:
+        """Température des fumées, None sans mesure depuis MESURE_FUMEE_PERIMEE secondes (sonde muette)."""
+        fumee = self.capteurs['Température fumée']
+        if fumee.horodatage is None or time.monotonic() - fumee.horodatage > MESURE_FUMEE_PERIMEE:
+            return None
+        return fumee.lire_valeur()
+
     def obtenir_valeurs_capteurs(self):
         """Retourne les valeurs actuelles des capteurs sous forme de dictionnaire."""
         return {nom: capteur.lire_valeur() for nom, capteur in self.capteurs.items()}
 
     def demarrer(self):
-        self.en_marche = True
-        self.config.modifier_etat(True)
-        CH340.toggle_relay(1)
+        if self.chien_de_garde.verrouille:
+            return f"Démarrage impossible, défaut de sécurité: {self.chien_de_garde.defaut}"
+        if self.sequenceur.phase != Phase.ARRET:
+            return f"Démarrage impossible pendant la phase {self.sequenceur.phase}"
+        if self.lire_temperature_fumee() is None:
+            return "Démarrage impossible: aucune mesure de température des fumées"
+        if ENREGISTREUR is not None:
+            ENREGISTREUR.commande('demarrer')
+        with TRACEUR.span('poele.demarrer'):
+            self.en_marche = True
+            self.config.modifier_etat(True)
+            self.sequenceur.allumer()
+        TRACEUR.ouvrir_attente('capteur.premier_changement')
         return "Démarrage du poêle..."
 
     def arreter(self):
-        self.en_marche = False
-        self.config.modifier_etat(False)
-        CH340.toggle_relay(1)
+        if ENREGISTREUR is not None:
+            ENREGISTREUR.commande('arreter')
+        with TRACEUR.span('poele.arreter'):
+            self.en_marche = False
+            self.config.modifier_etat(False)
+            self.sequenceur.eteindre()
         return "Arrêt du poêle..."
 
     def modifier_parametre(self, param: str, valeur: float) -> str:
+        if ENREGISTREUR is not None:
+            ENREGISTREUR.commande(f'parametre {param} {valeur}')
         if param in self.parametres:
             if self.config.modifier_parametre(param, valeur):
                 self.parametres = self.config.parametres
@@ -179,14 +587,19 @@ class ControlePoele:
 
 
 class Interface:
-    def __init__(self, stdscr):
+    def __init__(self, stdscr, serveur_metriques: Optional[ServeurMetriques] = None):
         self.stdscr = stdscr
         self.poele = ControlePoele()
+        if serveur_metriques is not None:
+            serveur_metriques.ajouter_route('/comptabilite', self.poele.comptable.resume)
         self.menu_principal = [
             "Démarrer/Arrêter le poêle",
             "Afficher les capteurs",
+            "Afficher les tendances",
             "Modifier les paramètres",
             "Voir l'historique",
+            "Consommation et compteurs",
+            "Acquitter le défaut de sécurité",
             "Quitter"
         ]
         self.menu_parametres = [
@@ -211,8 +624,17 @@ class Interface:
         curses.init_pair(2, curses.COLOR_GREEN, curses.COLOR_BLACK)  # Pour les messages
         curses.init_pair(3, curses.COLOR_YELLOW, curses.COLOR_BLACK)  # Pour les valeurs
         self.stdscr.timeout(1000)  # Rafraîchissement toutes les secondes
+        for canal, nom in self.poele.capteurs_entrees.items():
+            if canal in POELE.entrees:
+                POELE.entrees[canal].abonner(
+                    lambda _canal, etat, _arrivee, nom=nom: setattr(self, 'message', f"{nom}: {etat}")
+                )
 
     def afficher_menu(self, menu: List[str], titre: str):
+        with DUREE_IMAGE.chronometrer():
+            self._dessiner_menu(menu, titre)
+
+    def _dessiner_menu(self, menu: List[str], titre: str):
         self.stdscr.clear()
         height, width = self.stdscr.getmaxyx()
 
@@ -220,7 +642,9 @@ class Interface:
         self.stdscr.addstr(1, 2, f"=== {titre} ===")
 
         # Affiche l'état du poêle
-        etat = "En marche" if self.poele.en_marche else "Arrêté"
+        etat = f"{'En marche' if self.poele.en_marche else 'Arrêté'} ({self.poele.sequenceur.phase})"
+        if self.poele.chien_de_garde.verrouille:
+            etat = f"MISE EN SÉCURITÉ ({self.poele.chien_de_garde.defaut})"
         self.stdscr.addstr(3, 2, f"État du poêle: {etat}")
 
         # Affiche le message
@@ -276,10 +700,16 @@ class Interface:
         elif self.position_principale == 1:
             self.afficher_capteurs()
         elif self.position_principale == 2:
-            self.gerer_parametres()
+            self.afficher_tendances()
         elif self.position_principale == 3:
-            self.afficher_historique()
+            self.gerer_parametres()
         elif self.position_principale == 4:
+            self.afficher_historique()
+        elif self.position_principale == 5:
+            self.afficher_comptabilite()
+        elif self.position_principale == 6:
+            self.message = self.poele.acquitter_defaut()
+        elif self.position_principale == 7:
             return False
         return True
 
@@ -301,22 +731,27 @@ class Interface:
                     self.modifier_parametre(self.position)
 
     def executer(self):
-        while True:
-            self.afficher_menu(self.menu_principal, "Menu Principal")
-            key = self.stdscr.getch()
-
-            if key == curses.KEY_UP and self.position_principale > 0:  # Utilise position_principale
-                self.position_principale -= 1
-            elif key == curses.KEY_DOWN and self.position_principale < len(self.menu_principal) - 1:
-                self.position_principale += 1
-            elif key == 10:  # Touche Entrée
-                if not self.menu_principal_action():
-                    break
+        try:
+            while True:
+                self.afficher_menu(self.menu_principal, "Menu Principal")
+                key = self.stdscr.getch()
+
+                if key == curses.KEY_UP and self.position_principale > 0:  # Utilise position_principale
+                    self.position_principale -= 1
+                elif key == curses.KEY_DOWN and self.position_principale < len(self.menu_principal) - 1:
+                    self.position_principale += 1
+                elif key == 10:  # Touche Entrée
+                    if not self.menu_principal_action():
+                        break
+        finally:
+            # Aussi sur Ctrl-C ou exception : vis et résistance coupées avant la fermeture des cartes
+            self.poele.cleanup()
 
     def afficher_capteurs(self):
         """Affiche les valeurs des capteurs"""
         self.position = 0
         while True:
+            debut_image = time.perf_counter()
             self.stdscr.clear()
             self.stdscr.addstr(1, 2, "=== État des Capteurs ===")
 
@@ -343,6 +778,7 @@ class Interface:
             # Instructions
             self.stdscr.addstr(retour_y + 2, 2, "Utilisez ↑/↓ pour naviguer, Entrée pour sélectionner")
             self.stdscr.refresh()
+            DUREE_IMAGE.observer(time.perf_counter() - debut_image)
 
             # Gestion des touches
             key = self.stdscr.getch()
@@ -355,6 +791,84 @@ class Interface:
                     self.position = 0  # Réinitialise la position locale
                     break
 
+    def afficher_tendances(self):
+        """Courbes des capteurs sur la fenêtre choisie (←/→), lues dans les tampons déjà agrégés."""
+        tendances = self.poele.tendances
+        niveau = 0
+        derniere_image = 0.0
+        while True:
+            debut_image = time.perf_counter()
+            self.stdscr.clear()
+            height, width = self.stdscr.getmaxyx()
+            largeur = max(10, min(tendances.courbes[CAPTEURS_TENDANCES[0]].capacite, width - 4))
+            fenetre = tendances.duree_fenetre(niveau)
+            duree_affichee = f"{fenetre / 3600:.0f} h" if fenetre >= 3600 else f"{fenetre / 60:.0f} min"
+            self.stdscr.addstr(1, 2, f"=== Tendances ({duree_affichee}) ===")
+
+            for idx, nom in enumerate(CAPTEURS_TENDANCES):
+                courbe = tendances.courbes[nom]
+                points = courbe.serie(niveau, largeur)
+                presentes = [v for v in points if v == v]
+                y = 3 + idx * 3
+                valeur = f"{courbe.derniere:.1f}" if courbe.derniere == courbe.derniere else "pas de mesure"
+                entete = f"{self.poele.capteurs[nom].nom}: {valeur}"
+                if presentes:
+                    entete += f"  (min {min(presentes):.1f}, max {max(presentes):.1f})"
+                self.stdscr.addstr(y, 2, entete)
+                self.stdscr.addstr(y + 1, 2, sparkline(points), curses.color_pair(3))
+
+            memoire = sum(courbe.memoire_octets() for courbe in tendances.courbes.values()) // len(tendances.courbes)
+            y = 3 + len(CAPTEURS_TENDANCES) * 3
+            self.stdscr.addstr(y, 2, f"Image: {derniere_image * 1000:.2f} ms  |  Mémoire: {memoire} octets par capteur")
+            self.stdscr.addstr(y + 1, 2, "←/→: Échelle de temps  |  q: Retour au menu principal")
+            self.stdscr.refresh()
+            derniere_image = time.perf_counter() - debut_image
+            DUREE_TENDANCES.observer(derniere_image)
+
+            key = self.stdscr.getch()
+            if key == ord('q'):
+                break
+            elif key == curses.KEY_LEFT and niveau > 0:
+                niveau -= 1
+            elif key == curses.KEY_RIGHT and niveau < len(tendances.courbes[CAPTEURS_TENDANCES[0]].tampons) - 1:
+                niveau += 1
+
+    def afficher_comptabilite(self):
+        """Affiche les compteurs de consommation et de fonctionnement (aucune lecture de fichier)."""
+        while True:
+            with DUREE_IMAGE.chronometrer():
+                resume = self.poele.comptable.resume()
+                self.stdscr.clear()
+                self.stdscr.addstr(1, 2, "=== Consommation et compteurs ===")
+                self.stdscr.addstr(
+                    3, 2, f"{'':14s}{'Pellets':>10s}{'Vis':>9s}{'Flamme':>9s}{'Démarrages':>12s}{'Échecs':>8s}"
+                )
+                for idx, (nom, periode) in enumerate((("Aujourd'hui", 'jour'), ("Ce mois", 'mois'),
+                                                       ("Cette saison", 'saison'), ("Total", 'total'))):
+                    totaux = resume[periode]
+                    self.stdscr.addstr(
+                        4 + idx, 2,
+                        f"{nom:14s}{totaux['pellets_grammes'] / 1000:8.1f}kg{totaux['vis_secondes'] / 3600:8.1f}h"
+                        f"{totaux['bruleur_secondes'] / 3600:8.1f}h{totaux['allumages']:12d}{totaux['echecs']:8d}",
+                        curses.color_pair(3)
+                    )
+                autonomie = resume['autonomie_heures']
+                self.stdscr.addstr(
+                    9, 2, f"Trémie: {resume['tremie_grammes'] / 1000:.1f} kg"
+                          + (f" (environ {autonomie:.0f} h de chauffe)" if autonomie is not None else "")
+                )
+                cycles = "  ".join(f"R{canal}: {n}" for canal, n in sorted(resume['cycles_relais'].items()))
+                self.stdscr.addstr(10, 2, f"Cycles relais: {cycles or 'aucun'}")
+                self.stdscr.addstr(12, 2, "r: Trémie remplie  |  q: Retour au menu principal")
+                self.stdscr.refresh()
+
+            key = self.stdscr.getch()
+            if key == ord('q'):
+                break
+            elif key == ord('r'):
+                self.poele.comptable.remplir_tremie()
+                self.poele.config.historique.ajouter_evenement("Comptabilité", "Trémie remplie")
+
     def modifier_parametre(self, param_idx: int):
         # Gère la modification d'un paramètre spécifique
         params = ['temperature_cible', 'vitesse_moteur_max', 'seuil_temperature_fumee']
@@ -454,9 +968,24 @@ class Interface:
 
 
 def main():
-    curses.wrapper(lambda stdscr: Interface(stdscr).executer())
+    if TRACEUR.actif:
+        TRACEUR.installer_export_signal("trace_poele.json")
+    try:
+        serveur_metriques = ServeurMetriques()
+        serveur_metriques.demarrer()
+    except OSError:
+        serveur_metriques = None  # Port déjà utilisé : on continue sans exposition des métriques
+    try:
+        curses.wrapper(lambda stdscr: Interface(stdscr, serveur_metriques).executer())
+    finally:
+        if serveur_metriques is not None:
+            serveur_metriques.arreter()
 
 
 if __name__ == "__main__":
-    main()
-    CH340.cleanup()
+    try:
+        main()
+    finally:
+        CARTES.cleanup()
+        if ENREGISTREUR is not None:
+            ENREGISTREUR.fermer()
@@ -0,0 +1,232 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Bornes par défaut des histogrammes de durée (en secondes)
+BORNES_DUREE = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class _Metrique:
+    type_prometheus = ''
+
+    def __init__(self, nom: str, description: str):
+        self.nom = nom
+        self.description = description
+        self._local = threading.local()
+        self._fragments: List = []
+        self._verrou = threading.Lock()
+
+    def _fragment(self):
+        """Retourne l'accumulateur propre au thread courant (créé au premier appel)."""
+        try:
+            return self._local.fragment
+        except AttributeError:
+            fragment = self._nouveau_fragment()
+            with self._verrou:
+                self._fragments.append(fragment)
+            self._local.fragment = fragment
+            return fragment
+
+    def _nouveau_fragment(self):
+        raise NotImplementedError
+
+    def exposer(self) -> List[str]:
+        raise NotImplementedError
+
+    def _entete(self) -> List[str]:
+        return [f'# HELP {self.nom} {self.description}', f'# TYPE {self.nom} {self.type_prometheus}']
+
+
+class Compteur(_Metrique):
+    """Compteur monotone, accumulé par thread sans verrou."""
+    type_prometheus = 'counter'
+
+    def _nouveau_fragment(self):
+        return [0.0]
+
+    def incrementer(self, valeur: float = 1.0):
+        self._fragment()[0] += valeur
+
+    def valeur(self) -> float:
+        return sum(fragment[0] for fragment in list(self._fragments))
+
+    def exposer(self) -> List[str]:
+        return self._entete() + [f'{self.nom} {self.valeur()}']
+
+
+class Jauge(_Metrique):
+    """Valeur instantanée ; une simple affectation suffit."""
+    type_prometheus = 'gauge'
+
+    def __init__(self, nom: str, description: str):
+        super().__init__(nom, description)
+        self._valeur = 0.0
+
+    def definir(self, valeur: float):
+        self._valeur = valeur
+
+    def valeur(self) -> float:
+        return self._valeur
+
+    def exposer(self) -> List[str]:
+        return self._entete() + [f'{self.nom} {self._valeur}']
+
+
+class Histogramme(_Metrique):
+    """Histogramme à bornes fixes, accumulé par thread sans verrou."""
+    type_prometheus = 'histogram'
+
+    def __init__(self, nom: str, description: str, bornes: Sequence[float] = BORNES_DUREE):
+        super().__init__(nom, description)
+        self.bornes = tuple(sorted(bornes))
+
+    def _nouveau_fragment(self):
+        # [compte par seau..., seau +Inf, somme]
+        return [0] * (len(self.bornes) + 1) + [0.0]
+
+    def observer(self, valeur: float):
+        fragment = self._fragment()
+        fragment[bisect_left(self.bornes, valeur)] += 1
+        fragment[-1] += valeur
+
+    def chronometrer(self):
+        """Gestionnaire de contexte qui observe la durée du bloc."""
+        return _Chronometre(self)
+
+    def totaux(self) -> Tuple[List[int], float]:
+        """Retourne les comptes par seau (non cumulés) et la somme des observations."""
+        comptes = [0] * (len(self.bornes) + 1)
+        somme = 0.0
+        for fragment in list(self._fragments):
+            for i in range(len(comptes)):
+                comptes[i] += fragment[i]
+            somme += fragment[-1]
+        return comptes, somme
+
+    def exposer(self) -> List[str]:
+        comptes, somme = self.totaux()
+        lignes = self._entete()
+        cumul = 0
+        for borne, compte in zip(self.bornes, comptes):
+            cumul += compte
+            lignes.append(f'{self.nom}_bucket{{le="{borne}"}} {cumul}')
+        cumul += comptes[-1]
+        lignes.append(f'{self.nom}_bucket{{le="+Inf"}} {cumul}')
+        lignes.append(f'{self.nom}_sum {somme}')
+        lignes.append(f'{self.nom}_count {cumul}')
+        return lignes
+
+
+class _Chronometre:
+    __slots__ = ('histogramme', 'debut')
+
+    def __init__(self, histogramme: Histogramme):
+        self.histogramme = histogramme
+
+    def __enter__(self):
+        self.debut = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogramme.observer(time.perf_counter() - self.debut)
+        return False
+
+
+class RegistreMetriques:
+    def __init__(self):
+        self.metriques: Dict[str, _Metrique] = {}
+        self._verrou = threading.Lock()
+
+    def _enregistrer(self, classe, nom: str, *args):
+        """Retourne la métrique existante ou en crée une nouvelle."""
+        with self._verrou:
+            if nom not in self.metriques:
+                self.metriques[nom] = classe(nom, *args)
+            return self.metriques[nom]
+
+    def compteur(self, nom: str, description: str) -> Compteur:
+        return self._enregistrer(Compteur, nom, description)
+
+    def jauge(self, nom: str, description: str) -> Jauge:
+        return self._enregistrer(Jauge, nom, description)
+
+    def histogramme(self, nom: str, description: str, bornes: Sequence[float] = BORNES_DUREE) -> Histogramme:
+        return self._enregistrer(Histogramme, nom, description, bornes)
+
+    def exposer(self) -> str:
+        """Retourne toutes les métriques au format texte Prometheus."""
+        lignes = []
+        for metrique in list(self.metriques.values()):
+            lignes.extend(metrique.exposer())
+        return '\n'.join(lignes) + '\n'
+
+
+REGISTRE = RegistreMetriques()
+
+
+class ServeurMetriques:
+    """
+    Expose le registre sur http://<adresse>:<port>/metrics (local uniquement par défaut),
+    ainsi que les routes JSON ajoutées par `ajouter_route`.
+    """
+
+    def __init__(self, registre: RegistreMetriques = REGISTRE, adresse: str = '127.0.0.1', port: int = 9108):
+        registre_servi = registre
+        self.routes: Dict[str, Callable[[], dict]] = {}
+        routes = self.routes
+
+        class _Gestionnaire(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path in routes:
+                    corps = json.dumps(routes[self.path](), ensure_ascii=False).encode()
+                    type_contenu = 'application/json; charset=utf-8'
+                elif self.path == '/metrics':
+                    corps = registre_servi.exposer().encode()
+                    type_contenu = 'text/plain; version=0.0.4; charset=utf-8'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', type_contenu)
+                self.send_header('Content-Length', str(len(corps)))
+                self.end_headers()
+                self.wfile.write(corps)
+
+            def log_message(self, format, *args):
+                pass  # Ne pas écrire dans le terminal curses
+
+        self.serveur = ThreadingHTTPServer((adresse, port), _Gestionnaire)
+        self.thread: Optional[threading.Thread] = None
+
+    def ajouter_route(self, chemin: str, produire: Callable[[], dict]):
+        """Sert `produire()` en JSON sur `chemin` (état du poêle, compteurs...)."""
+        self.routes[chemin] = produire
+
+    def demarrer(self):
+        self.thread = threading.Thread(target=self.serveur.serve_forever, daemon=True)
+        self.thread.start()
+
+    def arreter(self):
+        self.serveur.shutdown()
+        self.serveur.server_close()
+
+
+if __name__ == "__main__":
+    # Mesure du coût d'une observation (objectif : quelques µs sur un Pi 4)
+    import timeit
+
+    registre = RegistreMetriques()
+    compteur = registre.compteur('bench_total', 'Compteur de test')
+    histogramme = registre.histogramme('bench_secondes', 'Histogramme de test')
+    n = 200_000
+
+    for nom, instruction in [
+        ('Compteur.incrementer', lambda: compteur.incrementer()),
+        ('Histogramme.observer', lambda: histogramme.observer(0.003)),
+        ('Histogramme.chronometrer', lambda: histogramme.chronometrer().__enter__().__exit__()),
+    ]:
+        duree = min(timeit.repeat(instruction, number=n, repeat=5))
+        print(f"{nom:26s}: {duree / n * 1e6:.3f} µs par observation")
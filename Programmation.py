@@ -0,0 +1,282 @@
+import heapq
+import itertools
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, time, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+UNE_SEMAINE = timedelta(days=7)
+MODE_ARRET = 'arret'
+# Les échéances sont en heure locale naïve : un changement d'heure décale l'attente calculée d'une heure.
+# Le thread se réveille au moins à cet intervalle pour réévaluer l'heure (retard borné à 15 min).
+ATTENTE_MAX = 900.0
+NOUVEL_ESSAI = 60.0  # Intervalle entre deux tentatives d'une consigne refusée (poêle en refroidissement, défaut...)
+LIMITES_CONSIGNE = (15.0, 30.0)  # Plage acceptée pour la température cible (voir LIMITES_PARAMETRES dans Main.py)
+
+
+@dataclass(frozen=True)
+class Plage:
+    """Fenêtre hebdomadaire : les jours (0 = lundi), l'heure de début, l'heure de fin et le mode."""
+    jours: Tuple[int, ...]
+    debut: time
+    fin: time  # Si fin <= debut, la plage se termine le lendemain
+    mode: str
+
+    def fenetre(self, jour: datetime) -> Tuple[datetime, datetime]:
+        """Retourne le début et la fin de la plage commençant à la date `jour`."""
+        debut = datetime.combine(jour.date(), self.debut)
+        fin = datetime.combine(jour.date(), self.fin)
+        if fin <= debut:
+            fin += timedelta(days=1)
+        return debut, fin
+
+
+@dataclass(frozen=True)
+class Derogation:
+    """Consigne ponctuelle qui remplace la programmation entre deux instants."""
+    debut: datetime
+    fin: datetime
+    mode: str
+
+
+@dataclass
+class Programmation:
+    modes: Dict[str, float] = field(default_factory=lambda: {'confort': 21.0, 'eco': 17.0})
+    plages: List[Plage] = field(default_factory=list)
+    derogations: List[Derogation] = field(default_factory=list)
+
+    @classmethod
+    def charger(cls, fichier: str) -> 'Programmation':
+        """Charge la programmation depuis le fichier JSON (programmation vide s'il n'existe pas)."""
+        if not os.path.exists(fichier):
+            return cls()
+        with open(fichier, 'r') as f:
+            donnees = json.load(f)
+        programmation = cls(
+            plages=[
+                Plage(tuple(p['jours']), time.fromisoformat(p['debut']), time.fromisoformat(p['fin']), p['mode'])
+                for p in donnees.get('plages', [])
+            ],
+            derogations=[
+                Derogation(datetime.fromisoformat(d['debut']), datetime.fromisoformat(d['fin']), d['mode'])
+                for d in donnees.get('derogations', [])
+            ],
+        )
+        if 'modes' in donnees:
+            programmation.modes = {mode: float(consigne) for mode, consigne in donnees['modes'].items()}
+        programmation.valider()
+        return programmation
+
+    def sauvegarder(self, fichier: str):
+        donnees = {
+            'modes': self.modes,
+            'plages': [
+                {'jours': list(p.jours), 'debut': p.debut.strftime('%H:%M'), 'fin': p.fin.strftime('%H:%M'),
+                 'mode': p.mode}
+                for p in self.plages
+            ],
+            'derogations': [
+                {'debut': d.debut.isoformat(timespec='minutes'), 'fin': d.fin.isoformat(timespec='minutes'),
+                 'mode': d.mode}
+                for d in self.derogations
+            ],
+        }
+        with open(fichier, 'w') as f:
+            json.dump(donnees, f, indent=4)
+
+    def valider(self):
+        """
+        Lève ValueError si la consigne d'un mode sort de LIMITES_CONSIGNE, ou si une plage ou une
+        dérogation référence un mode ou un jour inconnu.
+        """
+        minimum, maximum = LIMITES_CONSIGNE
+        for mode, consigne in self.modes.items():
+            if not minimum <= consigne <= maximum:
+                raise ValueError(f"Consigne du mode {mode} hors limites ({minimum}-{maximum}): {consigne}")
+        for plage in self.plages:
+            if plage.mode not in self.modes:
+                raise ValueError(f"Mode inconnu dans une plage: {plage.mode}")
+            if not plage.jours or any(not 0 <= jour <= 6 for jour in plage.jours):
+                raise ValueError(f"Jours invalides dans une plage: {plage.jours}")
+        for derogation in self.derogations:
+            if derogation.mode != MODE_ARRET and derogation.mode not in self.modes:
+                raise ValueError(f"Mode inconnu dans une dérogation: {derogation.mode}")
+            if derogation.fin <= derogation.debut:
+                raise ValueError("Une dérogation doit se terminer après son début")
+
+    def est_vide(self) -> bool:
+        return not self.plages and not self.derogations
+
+    def consigne_a(self, instant: datetime) -> Optional[float]:
+        """
+        Consigne en vigueur à `instant`, None si le poêle doit être arrêté.
+        Une dérogation active l'emporte (la dernière ajoutée en priorité), puis la première plage active.
+        """
+        for derogation in reversed(self.derogations):
+            if derogation.debut <= instant < derogation.fin:
+                return None if derogation.mode == MODE_ARRET else self.modes[derogation.mode]
+        for plage in self.plages:
+            # Une plage active a commencé aujourd'hui ou, si elle passe minuit, la veille
+            for decalage in (0, 1):
+                jour = instant - timedelta(days=decalage)
+                if jour.weekday() in plage.jours:
+                    debut, fin = plage.fenetre(jour)
+                    if debut <= instant < fin:
+                        return self.modes[plage.mode]
+        return None
+
+
+class Planificateur:
+    """
+    Applique la programmation aux instants de transition, calculés avec un tas.
+
+    Le thread dort jusqu'à la prochaine transition (au plus ATTENTE_MAX) au lieu de consulter l'horloge
+    à chaque tick ; chaque transition de plage est reprogrammée une semaine plus tard. `appliquer` retourne
+    False si la consigne n'a pas pu être appliquée : elle est alors retentée toutes les NOUVEL_ESSAI secondes.
+    """
+
+    def __init__(self, programmation: Programmation, appliquer: Callable[[Optional[float]], bool],
+                 horloge: Callable[[], datetime] = datetime.now):
+        self.programmation = programmation
+        self.appliquer = appliquer
+        self.horloge = horloge
+        self.tas: List[Tuple[datetime, int, Optional[timedelta]]] = []
+        self.compteur = itertools.count()
+        self.consigne_appliquee: Optional[float] = None
+        self.refusee = False  # La dernière consigne demandée a été refusée, à retenter
+        self.transitions = 0
+        self.running = False
+        self.reveil = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self._construire_tas(self.horloge())
+
+    def _construire_tas(self, maintenant: datetime):
+        """Place dans le tas la prochaine occurrence de chaque début et fin de plage et de dérogation."""
+        self.tas = []
+        for plage in self.programmation.plages:
+            for jour in plage.jours:
+                # Occurrence de cette semaine (commencée depuis moins d'une semaine)
+                date = maintenant + timedelta(days=(jour - maintenant.weekday()) % 7)
+                for instant in plage.fenetre(date):
+                    while instant > maintenant:
+                        instant -= UNE_SEMAINE
+                    self._pousser(instant + UNE_SEMAINE, UNE_SEMAINE)
+        for derogation in self.programmation.derogations:
+            for instant in (derogation.debut, derogation.fin):
+                if instant > maintenant:
+                    self._pousser(instant, None)
+
+    def _pousser(self, instant: datetime, reconduction: Optional[timedelta]):
+        heapq.heappush(self.tas, (instant, next(self.compteur), reconduction))
+
+    def prochaine_transition(self) -> Optional[datetime]:
+        return self.tas[0][0] if self.tas else None
+
+    def _appliquer_a(self, instant: datetime):
+        consigne = self.programmation.consigne_a(instant)
+        self.refusee = False
+        if consigne != self.consigne_appliquee:
+            if not self.appliquer(consigne):
+                self.refusee = True
+                return
+            self.consigne_appliquee = consigne
+            self.transitions += 1
+
+    def executer_jusqu_a(self, instant: datetime):
+        """Traite toutes les transitions échues jusqu'à `instant` inclus."""
+        while self.tas and self.tas[0][0] <= instant:
+            echeance, _, reconduction = heapq.heappop(self.tas)
+            if reconduction is not None:
+                self._pousser(echeance + reconduction, reconduction)
+            # Plusieurs transitions simultanées : n'appliquer l'état qu'une fois
+            if not self.tas or self.tas[0][0] != echeance:
+                self._appliquer_a(echeance)
+
+    def reprogrammer(self, programmation: Programmation):
+        """Remplace la programmation ; le thread recalcule ses échéances à son réveil."""
+        self.programmation = programmation
+        self.reveil.set()
+
+    def demarrer(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._executer, daemon=True)
+        self.thread.start()
+
+    def _executer(self):
+        self._appliquer_a(self.horloge())
+        while self.running:
+            prochaine = self.prochaine_transition()
+            delai = NOUVEL_ESSAI if self.refusee else None
+            if prochaine is not None:
+                delai = min(delai or ATTENTE_MAX, max(0.0, (prochaine - self.horloge()).total_seconds()))
+            if self.reveil.wait(delai):
+                self.reveil.clear()
+                if not self.running:
+                    break
+                maintenant = self.horloge()
+                self._construire_tas(maintenant)
+                self._appliquer_a(maintenant)
+                continue
+            self.executer_jusqu_a(self.horloge())
+            if self.refusee:
+                self._appliquer_a(self.horloge())
+
+    def arreter(self):
+        self.running = False
+        self.reveil.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+
+
+if __name__ == "__main__":
+    # Simulation d'une année de programmation sur une horloge virtuelle et mesure du coût CPU.
+    # Déterministe (horloge virtuelle, tirage fixe) : toute erreur termine le script en échec.
+    import random
+    import time as chrono
+
+    programmation = Programmation(
+        plages=[
+            Plage((0, 1, 2, 3, 4), time(6, 30), time(8, 30), 'confort'),
+            Plage((0, 1, 2, 3, 4), time(17, 30), time(22, 30), 'confort'),
+            Plage((0, 1, 2, 3, 4), time(22, 30), time(6, 30), 'eco'),
+            Plage((5, 6), time(8, 0), time(23, 0), 'confort'),
+            Plage((5, 6), time(23, 0), time(8, 0), 'eco'),
+        ],
+    )
+    debut = datetime(2026, 1, 1)
+    random.seed(1)
+    for _ in range(20):
+        depart = debut + timedelta(minutes=random.randrange(365 * 24 * 60))
+        programmation.derogations.append(
+            Derogation(depart, depart + timedelta(hours=random.randint(1, 72)), random.choice(['confort', MODE_ARRET]))
+        )
+
+    appliquees = []
+    horloge = [debut]
+
+    def appliquer(consigne: Optional[float]) -> bool:
+        appliquees.append((horloge[0], consigne))
+        return True
+
+    planificateur = Planificateur(programmation, appliquer, horloge=lambda: horloge[0])
+    planificateur._appliquer_a(debut)
+
+    cpu = chrono.process_time()
+    fin = debut + timedelta(days=365)
+    while planificateur.prochaine_transition() <= fin:
+        horloge[0] = planificateur.prochaine_transition()
+        planificateur.executer_jusqu_a(horloge[0])
+    cpu = chrono.process_time() - cpu
+
+    # Vérification : l'année entière est parcourue et chaque consigne appliquée reste en vigueur
+    # jusqu'à la transition suivante
+    assert fin - horloge[0] < timedelta(days=1), horloge[0]
+    assert planificateur.transitions == len(appliquees), (planificateur.transitions, len(appliquees))
+    assert all(a[1] != b[1] for a, b in zip(appliquees, appliquees[1:])), "Consigne appliquée deux fois"
+    for (instant, consigne), (suivant, _) in zip(appliquees, appliquees[1:] + [(fin, None)]):
+        milieu = instant + (suivant - instant) / 2
+        assert programmation.consigne_a(milieu) == consigne, (instant, milieu, consigne)
+    print(f"{planificateur.transitions} transitions sur un an, {cpu * 1000:.1f} ms CPU "
+          f"({cpu / max(1, planificateur.transitions) * 1e6:.1f} µs par transition)")
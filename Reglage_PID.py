@@ -0,0 +1,251 @@
+import csv
+import json
+import os
+import struct
+from dataclasses import dataclass
+from typing import Dict, Tuple
+import numpy as np
+from Enregistrement import FORMAT_TELEMETRIE, TELEMETRIE, lire_session
+
+# Colonnes de la télémétrie : instant (s), ambiante (°C), fumée (°C), part de marche de la vis, vitesse moteur (tr/min)
+COLONNES = ('instant', 'ambiante', 'fumee', 'duty', 'vitesse')
+
+# Pondération du classement : un point = 0,1 °C de dépassement = 1 min de stabilisation = 100 g de pellets
+POIDS_DEPASSEMENT = 10.0
+POIDS_STABILISATION = 1.0 / 60.0
+POIDS_PELLETS = 1.0 / 100.0
+
+
+def charger_telemetrie(chemin: str) -> Dict[str, np.ndarray]:
+    """Charge la télémétrie d'une session enregistrée (POELE_ENREGISTREMENT) ou d'un fichier CSV."""
+    if chemin.endswith('.csv'):
+        with open(chemin, newline='') as f:
+            lignes = [[float(ligne[colonne]) for colonne in COLONNES] for ligne in csv.DictReader(f)]
+    else:
+        lignes = [(instant,) + struct.unpack(FORMAT_TELEMETRIE, donnees)
+                  for type_record, instant, donnees in lire_session(chemin) if type_record == TELEMETRIE]
+    tableau = np.array(lignes, dtype=float).reshape(-1, len(COLONNES))
+    # Les capteurs pas encore mesurés sont enregistrés en NaN : ces lignes ne servent pas à l'ajustement
+    tableau = tableau[np.isfinite(tableau).all(axis=1)]
+    if len(tableau) < 10:
+        raise ValueError(f"{chemin}: pas assez de télémétrie mesurée ({len(tableau)} lignes sur {len(lignes)})")
+    return {colonne: tableau[:, i] for i, colonne in enumerate(COLONNES)}
+
+
+@dataclass
+class ModeleThermique:
+    """
+    Modèle linéaire en ses paramètres, ajusté par moindres carrés :
+        dF/dt = a0 + a1·duty + a2·(F - T) + a3·v·(F - T)   (F fumées, T ambiante, v vitesse en milliers de tr/min)
+        dT/dt = b0 + b1·(F - T) + b2·T
+    """
+    a: np.ndarray
+    b: np.ndarray
+    residu_fumee: float = 0.0
+    residu_ambiante: float = 0.0
+
+    @classmethod
+    def ajuster(cls, telemetrie: Dict[str, np.ndarray], pas: float = 10.0) -> 'ModeleThermique':
+        # Rééchantillonnage sur une grille régulière ; la vis (tout ou rien) est moyennée sur chaque pas
+        instant = telemetrie['instant']
+        grille = np.arange(instant[0], instant[-1], pas)
+        cumul_duty = np.concatenate(([0.0], np.cumsum(telemetrie['duty'][:-1] * np.diff(instant))))
+        duty = np.diff(np.interp(grille, instant, cumul_duty)) / pas
+        T = np.interp(grille, instant, telemetrie['ambiante'])
+        F = np.interp(grille, instant, telemetrie['fumee'])
+        v = np.interp(grille, instant, telemetrie['vitesse']) / 1000.0
+        # Dérivées centrées : le bruit de mesure de l'échantillon k ne figure pas dans (X[k+1] - X[k-1]), sinon
+        # il se retrouve à la fois dans la dérivée et dans les régresseurs et biaise l'ajustement
+        ecart = (F - T)[1:-1]
+        derivee_fumee = (F[2:] - F[:-2]) / (2 * pas)
+        derivee_ambiante = (T[2:] - T[:-2]) / (2 * pas)
+
+        regresseurs_fumee = np.column_stack((np.ones_like(ecart), (duty[:-1] + duty[1:]) / 2, ecart, v[1:-1] * ecart))
+        regresseurs_ambiante = np.column_stack((np.ones_like(ecart), ecart, T[1:-1]))
+        # Vitesse constante : a2 et a3 ne sont pas séparables, lstsq retourne la solution de norme minimale
+        a = np.linalg.lstsq(regresseurs_fumee, derivee_fumee, rcond=None)[0]
+        b = np.linalg.lstsq(regresseurs_ambiante, derivee_ambiante, rcond=None)[0]
+        residu_fumee = np.sqrt(np.mean((regresseurs_fumee @ a - derivee_fumee) ** 2)) * pas
+        residu_ambiante = np.sqrt(np.mean((regresseurs_ambiante @ b - derivee_ambiante) ** 2)) * pas
+        return cls(a, b, float(residu_fumee), float(residu_ambiante))
+
+
+@dataclass
+class Scenario:
+    """Montée en température depuis l'entrée en modulation, flamme établie."""
+    consigne: float = 21.0
+    ambiante_initiale: float = 16.0
+    fumee_initiale: float = 120.0
+    vitesse: float = 1500.0
+    duree: float = 4 * 3600.0
+    pas: float = 10.0  # = ParametresSequence.periode_pid
+    duty_min: float = 0.15
+    duty_max: float = 0.8
+    debit_vis: float = 1.2
+    tolerance: float = 0.5  # Bande de stabilisation autour de la consigne (°C)
+
+
+def simuler_lot(modele: ModeleThermique, scenario: Scenario,
+                kp: np.ndarray, ki: np.ndarray, kd: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Simule tous les jeux de gains à la fois (un élément de tableau par candidat), avec la même loi que
+    Sequenceur.duty_modulation. Retourne dépassement (°C), temps de stabilisation (s) et pellets (g).
+    """
+    a, b, s = modele.a, modele.b, scenario
+    n = len(kp)
+    T = np.full(n, s.ambiante_initiale)
+    F = np.full(n, s.fumee_initiale)
+    integrale = np.zeros(n)
+    erreur_precedente = np.full(n, s.consigne - s.ambiante_initiale)
+    maximum = T.copy()
+    derniere_sortie = np.zeros(n)
+    duty_cumule = np.zeros(n)
+    v = s.vitesse / 1000.0
+
+    for k in range(int(s.duree / s.pas)):
+        erreur = s.consigne - T
+        derivee = (erreur - erreur_precedente) / s.pas if k else np.zeros(n)
+        integrale_candidate = integrale + erreur * s.pas
+        brut = s.duty_min + kp * erreur + ki * integrale_candidate + kd * derivee
+        non_sature = (brut >= s.duty_min) & (brut <= s.duty_max)
+        integrale = np.where(non_sature, integrale_candidate, integrale)
+        brut = s.duty_min + kp * erreur + ki * integrale + kd * derivee
+        duty = np.clip(brut, s.duty_min, s.duty_max)
+        erreur_precedente = erreur
+
+        ecart = F - T
+        F = F + s.pas * (a[0] + a[1] * duty + a[2] * ecart + a[3] * v * ecart)
+        T = T + s.pas * (b[0] + b[1] * ecart + b[2] * T)
+        duty_cumule += duty
+        np.maximum(maximum, T, out=maximum)
+        derniere_sortie = np.where(np.abs(T - s.consigne) > s.tolerance, (k + 1) * s.pas, derniere_sortie)
+
+    return {
+        'depassement': np.maximum(0.0, maximum - s.consigne),
+        'stabilisation': derniere_sortie,
+        'pellets': duty_cumule * s.pas * s.debit_vis,
+    }
+
+
+def simuler_un(modele: ModeleThermique, scenario: Scenario, kp: float, ki: float, kd: float) -> Tuple[float, ...]:
+    """Même simulation pour un seul candidat, en Python pur (référence du banc d'essai)."""
+    a, b, s = modele.a, modele.b, scenario
+    T, F, integrale = s.ambiante_initiale, s.fumee_initiale, 0.0
+    erreur_precedente = s.consigne - T
+    maximum, derniere_sortie, duty_cumule = T, 0.0, 0.0
+    v = s.vitesse / 1000.0
+    for k in range(int(s.duree / s.pas)):
+        erreur = s.consigne - T
+        derivee = (erreur - erreur_precedente) / s.pas if k else 0.0
+        brut = s.duty_min + kp * erreur + ki * (integrale + erreur * s.pas) + kd * derivee
+        if s.duty_min <= brut <= s.duty_max:
+            integrale += erreur * s.pas
+        brut = s.duty_min + kp * erreur + ki * integrale + kd * derivee
+        duty = min(s.duty_max, max(s.duty_min, brut))
+        erreur_precedente = erreur
+        ecart = F - T
+        F += s.pas * (a[0] + a[1] * duty + a[2] * ecart + a[3] * v * ecart)
+        T += s.pas * (b[0] + b[1] * ecart + b[2] * T)
+        duty_cumule += duty
+        maximum = max(maximum, T)
+        if abs(T - s.consigne) > s.tolerance:
+            derniere_sortie = (k + 1) * s.pas
+    return max(0.0, maximum - s.consigne), derniere_sortie, duty_cumule * s.pas * s.debit_vis
+
+
+def grille_gains(candidats: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Grille régulière d'environ `candidats` jeux de gains, dans les limites acceptées par Main.py."""
+    cote = max(2, round(candidats ** (1 / 3)))
+    kp, ki, kd = np.meshgrid(np.linspace(0.0, 1.0, cote), np.linspace(0.0, 0.002, cote),
+                             np.linspace(0.0, 100.0, cote), indexing='ij')
+    return kp.ravel(), ki.ravel(), kd.ravel()
+
+
+def classer(resultats: Dict[str, np.ndarray]) -> np.ndarray:
+    """Indices des candidats du meilleur au moins bon (score pondéré, voir POIDS_*)."""
+    score = (POIDS_DEPASSEMENT * resultats['depassement'] + POIDS_STABILISATION * resultats['stabilisation']
+             + POIDS_PELLETS * resultats['pellets'])
+    return np.argsort(score, kind='stable')
+
+
+def exporter_gains(fichier: str, kp: float, ki: float, kd: float):
+    """Écrit les gains dans config_poele.json ; le poêle en marche les recharge à chaud."""
+    with open(fichier, 'r') as f:
+        config = json.load(f)
+    config.update(pid_kp=round(kp, 6), pid_ki=round(ki, 8), pid_kd=round(kd, 4))
+    fichier_temporaire = fichier + ".tmp"
+    with open(fichier_temporaire, 'w') as f:
+        json.dump(config, f, indent=4)
+    os.replace(fichier_temporaire, fichier)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Ajuste un modèle thermique et classe des gains PID hors ligne")
+    parser.add_argument('telemetrie', nargs='?', help="session enregistrée ou CSV (sans argument : données de démonstration)")
+    parser.add_argument('--consigne', type=float, default=21.0)
+    parser.add_argument('--candidats', type=int, default=8000)
+    parser.add_argument('--exporter', metavar='CONFIG', help="écrit les meilleurs gains dans ce fichier de configuration")
+    args = parser.parse_args()
+
+    if args.telemetrie:
+        telemetrie = charger_telemetrie(args.telemetrie)
+    else:
+        # Télémétrie synthétique issue d'un modèle connu, pour vérifier que l'ajustement le retrouve
+        # (extérieur à 5 °C, constante de temps de la pièce de 2 h)
+        reference = ModeleThermique(np.array([0.0, 0.7, -0.004, -0.002]), np.array([0.000694, 0.0000472, -0.000139]))
+        rng = np.random.default_rng(1)
+        instant = np.arange(0.0, 12 * 3600.0, 1.0)
+        duty = (rng.random(len(instant) // 600).repeat(600) * 0.8)[:len(instant)]
+        vitesse = np.full(len(instant), 1500.0)
+        T, F = np.empty(len(instant)), np.empty(len(instant))
+        T[0], F[0] = 16.0, 20.0
+        for k in range(len(instant) - 1):
+            ecart = F[k] - T[k]
+            a, b = reference.a, reference.b
+            F[k + 1] = F[k] + a[0] + a[1] * duty[k] + a[2] * ecart + a[3] * 1.5 * ecart
+            T[k + 1] = T[k] + b[0] + b[1] * ecart + b[2] * T[k]
+        telemetrie = {'instant': instant, 'ambiante': T + rng.normal(0, 0.05, len(T)),
+                      'fumee': F + rng.normal(0, 0.5, len(F)), 'duty': duty, 'vitesse': vitesse}
+        print(f"Modèle de référence : a={reference.a}, b={reference.b}")
+
+    modele = ModeleThermique.ajuster(telemetrie)
+    print(f"Modèle ajusté       : a={np.round(modele.a, 6)}, b={np.round(modele.b, 7)}")
+    print(f"Résidus par pas : fumées {modele.residu_fumee:.3f} °C, ambiante {modele.residu_ambiante:.4f} °C")
+    if not args.telemetrie:
+        # a2 et a3 ne sont pas séparables à vitesse constante : seul a2 + v·a3 est identifiable
+        assert abs(modele.a[0] - reference.a[0]) < 0.01, modele.a
+        assert np.isclose(modele.a[1], reference.a[1], rtol=0.05), modele.a
+        assert np.isclose(modele.a[2] + 1.5 * modele.a[3], reference.a[2] + 1.5 * reference.a[3], rtol=0.05), modele.a
+        assert np.allclose(modele.b, reference.b, rtol=0.05), modele.b
+
+    scenario = Scenario(consigne=args.consigne, vitesse=float(np.median(telemetrie['vitesse'])))
+    kp, ki, kd = grille_gains(args.candidats)
+
+    debut = time.perf_counter()
+    resultats = simuler_lot(modele, scenario, kp, ki, kd)
+    duree_lot = time.perf_counter() - debut
+
+    echantillon = np.linspace(0, len(kp) - 1, 50).astype(int)
+    debut = time.perf_counter()
+    naifs = [simuler_un(modele, scenario, kp[i], ki[i], kd[i]) for i in echantillon]
+    duree_naif = time.perf_counter() - debut
+    for i, naif in zip(echantillon, naifs):
+        attendu = (resultats['depassement'][i], resultats['stabilisation'][i], resultats['pellets'][i])
+        assert np.allclose(naif, attendu), (i, naif, attendu)
+
+    print(f"{len(kp)} candidats : vectorisé {len(kp) / duree_lot:,.0f} candidats/s, "
+          f"boucle Python {len(echantillon) / duree_naif:,.0f} candidats/s "
+          f"(x{(len(kp) / duree_lot) / (len(echantillon) / duree_naif):.0f})")
+
+    ordre = classer(resultats)
+    print("Meilleurs gains :")
+    for i in ordre[:5]:
+        print(f"    kp={kp[i]:.4f} ki={ki[i]:.6f} kd={kd[i]:.1f} : dépassement {resultats['depassement'][i]:.2f} °C, "
+              f"stabilisation {resultats['stabilisation'][i] / 60:.0f} min, pellets {resultats['pellets'][i]:.0f} g")
+    if args.exporter:
+        meilleur = ordre[0]
+        exporter_gains(args.exporter, kp[meilleur], ki[meilleur], kd[meilleur])
+        print(f"Gains écrits dans {args.exporter}")
@@ -0,0 +1,244 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+from CH340 import RelayState
+from Metriques import REGISTRE
+
+# Relais concernés (voir le câblage dans Main.py)
+RELAIS_MOTEUR_FUMEE = 1
+RELAIS_VIS_PELLET = 3
+RELAIS_RESISTANCE = 4
+RELAIS_COUPE_CIRCUIT = 7
+RELAIS_PRESOSTA = 8
+
+# État sûr : vis et résistance coupées, extraction des fumées en marche
+ETAT_SUR = (
+    (RELAIS_VIS_PELLET, RelayState.OFF),
+    (RELAIS_RESISTANCE, RelayState.OFF),
+    (RELAIS_MOTEUR_FUMEE, RelayState.ON),
+)
+
+TEMPS_REACTION = REGISTRE.histogramme(
+    'securite_reaction_secondes',
+    "Délai entre la détection d'un défaut et l'envoi des commandes de mise en sécurité",
+    bornes=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25))
+DECLENCHEMENTS = REGISTRE.compteur('securite_declenchements_total', 'Mises en sécurité déclenchées')
+
+
+class ChienDeGarde:
+    """
+    Thread de surveillance indépendant de l'interface et de la boucle de contrôle.
+
+    Surveille la température des fumées, le presostat (retour relais 8) et le coupe-circuit
+    (retour relais 7), interrogés à chaque mise en marche. Sur défaut, impose l'état sûr par le
+    chemin rapide du RelayController et reste verrouillé jusqu'à l'acquittement, même si le défaut
+    disparaît.
+    """
+
+    def __init__(self, capteurs: Dict, relais, lire_seuil_fumee: Callable[[], float],
+                 est_en_marche: Callable[[], bool], sur_declenchement: Optional[Callable[[str], None]] = None,
+                 periode: float = 0.02, delai_armement: float = 15.0, priorite: int = -10):
+        self.capteurs = capteurs
+        self.relais = relais
+        self.lire_seuil_fumee = lire_seuil_fumee
+        self.est_en_marche = est_en_marche
+        self.sur_declenchement = sur_declenchement
+        self.periode = periode
+        # Délai après la mise en marche pendant lequel les retours presostat / coupe-circuit sont ignorés
+        # (montée en dépression du conduit, premier retour du module)
+        self.delai_armement = delai_armement
+        self.priorite = priorite
+        self.marche_depuis: Optional[float] = None
+        self.defaut: Optional[str] = None
+        self.derniere_reaction: Optional[float] = None
+        self.verrou = threading.Lock()  # Sérialise détection / déclenchement et acquittement
+        self.reveil = threading.Event()
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+        # Réévaluation immédiate sur changement d'une entrée, sans attendre la période
+        for canal in (RELAIS_COUPE_CIRCUIT, RELAIS_PRESOSTA):
+            if canal in self.relais.entrees:
+                self.relais.entrees[canal].abonner(lambda *_: self.reveil.set())
+
+    @property
+    def verrouille(self) -> bool:
+        return self.defaut is not None
+
+    def demarrer(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._surveiller, name='chien-de-garde', daemon=True)
+        self.thread.start()
+
+    def _surveiller(self):
+        try:
+            # Priorité renforcée pour ce thread seulement (nécessite CAP_SYS_NICE pour une valeur négative)
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.priorite)
+        except (OSError, AttributeError):
+            pass
+        while self.running:
+            debut = time.perf_counter()
+            declenche = None
+            with self.verrou:
+                if self.defaut is None:
+                    declenche = self.verifier()
+                    if declenche is not None:
+                        self.declencher(declenche, debut)
+                else:
+                    self._maintenir_etat_sur()
+            # Journalisation et interface seulement après l'envoi des commandes
+            if declenche is not None and self.sur_declenchement is not None:
+                self.sur_declenchement(declenche)
+            self.reveil.wait(self.periode)
+            self.reveil.clear()
+
+    def verifier(self) -> Optional[str]:
+        """Retourne la cause du défaut en cours, None si tout est normal."""
+        defaut = self._verifier_fumee()
+        if defaut is not None:
+            return defaut
+
+        if not self.est_en_marche():
+            self.marche_depuis = None
+            return None
+        if self.marche_depuis is None:
+            self.marche_depuis = time.monotonic()
+            self.interroger_entrees()
+        if time.monotonic() - self.marche_depuis < self.delai_armement:
+            return None
+        return self._verifier_entrees()
+
+    def _verifier_fumee(self) -> Optional[str]:
+        fumee = self.capteurs['Température fumée']
+        # Tant qu'aucune mesure n'est arrivée, la valeur du capteur n'est qu'une valeur initiale
+        if fumee.horodatage is not None and fumee.lire_valeur() > self.lire_seuil_fumee():
+            return "Surchauffe des fumées"
+        return None
+
+    def _verifier_entrees(self) -> Optional[str]:
+        """Retours coupe-circuit et presostat ; un canal qui n'a jamais répondu est un défaut distinct."""
+        for canal, ouvert, inconnu in (
+            (RELAIS_COUPE_CIRCUIT, "Coupe-circuit ouvert", "Coupe-circuit sans retour du module"),
+            (RELAIS_PRESOSTA, "Presostat ouvert (défaut de tirage)", "Presostat sans retour du module"),
+        ):
+            entree = self.relais.entrees.get(canal)
+            etat = self.relais.states[canal - 1] if entree is None else entree.etat
+            if etat is None:
+                self.relais.demander_etat(canal)
+                return inconnu
+            if etat != RelayState.ON:
+                return ouvert
+        return None
+
+    def interroger_entrees(self):
+        """Demande au module l'état des entrées, qu'il ne signale pas toujours de lui-même."""
+        for canal in (RELAIS_COUPE_CIRCUIT, RELAIS_PRESOSTA):
+            self.relais.demander_etat(canal)
+
+    def declencher(self, defaut: str, detection: float):
+        """Verrouille puis met le poêle en sécurité ; `detection` est le perf_counter() de la détection."""
+        self.defaut = defaut
+        ecrites = [self.relais.forcer_relais(relay_num, etat) for relay_num, etat in ETAT_SUR]
+        ecrites[-1].wait(timeout=1.0)  # Commandes de sécurité servies dans l'ordre : la dernière clôt la réaction
+        self.derniere_reaction = time.perf_counter() - detection
+        TEMPS_REACTION.observer(self.derniere_reaction)
+        DECLENCHEMENTS.incrementer()
+
+    def _maintenir_etat_sur(self):
+        """Tant que le défaut est verrouillé, rétablit l'état sûr si un autre composant l'a modifié."""
+        for relay_num, etat in ETAT_SUR:
+            if self.relais.states[relay_num - 1] != etat:
+                self.relais.forcer_relais(relay_num, etat)
+
+    def acquitter(self) -> bool:
+        """
+        Lève le verrouillage si le défaut a disparu. Retourne True si le défaut est acquitté.
+        Les entrées sont contrôlées même poêle arrêté (ce qui est toujours le cas après un déclenchement).
+        """
+        with self.verrou:
+            if self.defaut is None:
+                return True
+            if self._verifier_fumee() is not None or self._verifier_entrees() is not None:
+                return False
+            self.defaut = None
+            return True
+
+    def arreter(self):
+        self.running = False
+        self.reveil.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+
+
+if __name__ == "__main__":
+    # Mesure du temps de réaction sur le simulateur, avec journalisation et interface chargées.
+    # La borne porte sur des durées réelles : à lancer sur la machine cible, pas sur une machine déjà saturée.
+    import logging
+    import tempfile
+    from CH340 import RelayController
+    from Simulateur import PortSimule
+
+    class Capteur:
+        def __init__(self, valeur):
+            self.valeur = valeur
+            self.horodatage = time.monotonic()
+
+        def lire_valeur(self):
+            return self.valeur
+
+    class PortHorodate(PortSimule):
+        def write(self, donnees: bytes) -> int:
+            self.horodatages.append((time.perf_counter(), donnees))
+            return super().write(donnees)
+
+    port = PortHorodate()
+    port.horodatages = []
+    port.etats[RELAIS_COUPE_CIRCUIT - 1] = port.etats[RELAIS_PRESOSTA - 1] = 'ON'  # Entrées fermées
+    relais = RelayController(serial_port=port)
+    capteurs = {'Température fumée': Capteur(150.0)}
+    chien = ChienDeGarde(capteurs, relais, lambda: 200.0, lambda: True)
+    chien.demarrer()
+    time.sleep(0.2)  # Réponse du module à l'interrogation des entrées, puis anti-rebond
+
+    # Charge : journalisation intensive et commandes « utilisateur » en parallèle
+    charge_active = True
+    logger = logging.getLogger('charge')
+    logger.addHandler(logging.FileHandler(os.path.join(tempfile.mkdtemp(), 'charge.log')))
+    logger.setLevel(logging.INFO)
+
+    def journaliser():
+        while charge_active:
+            logger.info("x" * 200)
+
+    def interface():
+        while charge_active:
+            relais.toggle_relay(2)
+            sum(i * i for i in range(2000))
+
+    charges = [threading.Thread(target=cible, daemon=True) for cible in (journaliser, journaliser, interface)]
+    for thread in charges:
+        thread.start()
+
+    reactions = []
+    for essai in range(50):
+        time.sleep(0.05)
+        port.horodatages.clear()
+        injection = time.perf_counter()
+        capteurs['Température fumée'].valeur = 250.0
+        while not any(d == b'AT+C3' for _, d in port.horodatages):
+            assert time.perf_counter() - injection < 1.0, f"Essai {essai} : pas de mise en sécurité après 1 s"
+            time.sleep(0.0005)
+        commande = next(t for t, d in port.horodatages if d == b'AT+C3')
+        reactions.append(commande - injection)
+        capteurs['Température fumée'].valeur = 150.0
+        time.sleep(0.01)
+        assert chien.acquitter()
+
+    charge_active = False
+    chien.arreter()
+    relais.cleanup()
+    reactions.sort()
+    borne = chien.periode + relais.ordonnanceur.espacement + 0.05
+    print(f"Réaction défaut → commande : médiane {reactions[len(reactions) // 2] * 1000:.2f} ms, "
+          f"max {reactions[-1] * 1000:.2f} ms (borne {borne * 1000:.0f} ms)")
+    assert reactions[-1] < borne, "Temps de réaction hors borne"
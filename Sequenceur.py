@@ -0,0 +1,446 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Dict, Optional, Tuple
+from CH340 import PrioriteCommande, RelayState
+from Metriques import REGISTRE
+
+RELAIS_MOTEUR_FUMEE = 1
+RELAIS_VIS_PELLET = 3
+RELAIS_RESISTANCE = 4
+
+TEMPS_FLAMME = REGISTRE.histogramme(
+    'allumage_temps_flamme_secondes', "Durée entre la demande d'allumage et la détection de flamme",
+    bornes=(60, 120, 180, 240, 300, 420, 600, 900))
+PELLETS_ALLUMAGE = REGISTRE.histogramme(
+    'allumage_pellets_grammes', "Pellets dosés entre la demande d'allumage et la détection de flamme",
+    bornes=(10, 20, 30, 40, 60, 80, 120, 200))
+ECHECS_ALLUMAGE = REGISTRE.compteur('allumage_echecs_total', "Allumages ou extinctions terminés en échec")
+
+
+class Phase(Enum):
+    ARRET = 'arrêt'
+    PRE_VENTILATION = 'pré-ventilation'
+    PRECHAUFFAGE = 'préchauffage'
+    AMORCAGE = 'amorçage'
+    DETECTION_FLAMME = 'détection flamme'
+    STABILISATION = 'stabilisation'
+    MODULATION = 'modulation'
+    REFROIDISSEMENT = 'refroidissement'
+    ECHEC = 'échec'
+    ECHEC_FUMEES_CHAUDES = 'échec, fumées chaudes'
+
+    def __str__(self):
+        return self.value
+
+
+@dataclass(frozen=True)
+class DefinitionPhase:
+    """Une ligne de la table de transitions."""
+    sorties: Dict[int, RelayState]  # États imposés en entrant dans la phase
+    suivante: Phase
+    duree: Optional[float] = None  # Passage à `suivante` après cette durée...
+    condition: Optional[str] = None  # ...ou dès que cette condition (méthode du séquenceur) est vraie
+    delai_max: Optional[float] = None  # Au-delà, la phase échoue
+    cycle_vis: Optional[Tuple[float, float]] = None  # Vis pulsée : (secondes de marche, période)
+
+
+ON, OFF = RelayState.ON, RelayState.OFF
+
+TABLE_PHASES: Dict[Phase, DefinitionPhase] = {
+    Phase.ARRET: DefinitionPhase(
+        {RELAIS_MOTEUR_FUMEE: OFF, RELAIS_VIS_PELLET: OFF, RELAIS_RESISTANCE: OFF}, Phase.ARRET),
+    Phase.PRE_VENTILATION: DefinitionPhase(
+        {RELAIS_MOTEUR_FUMEE: ON, RELAIS_VIS_PELLET: OFF, RELAIS_RESISTANCE: OFF}, Phase.PRECHAUFFAGE,
+        duree=30.0),
+    Phase.PRECHAUFFAGE: DefinitionPhase(
+        {RELAIS_MOTEUR_FUMEE: ON, RELAIS_VIS_PELLET: OFF, RELAIS_RESISTANCE: ON}, Phase.AMORCAGE,
+        duree=60.0),
+    Phase.AMORCAGE: DefinitionPhase(
+        {RELAIS_MOTEUR_FUMEE: ON, RELAIS_RESISTANCE: ON}, Phase.DETECTION_FLAMME,
+        duree=20.0, cycle_vis=(1.0, 1.0)),
+    Phase.DETECTION_FLAMME: DefinitionPhase(
+        {RELAIS_MOTEUR_FUMEE: ON, RELAIS_RESISTANCE: ON}, Phase.STABILISATION,
+        condition='flamme_detectee', delai_max=600.0, cycle_vis=(1.5, 8.0)),
+    Phase.STABILISATION: DefinitionPhase(
+        {RELAIS_MOTEUR_FUMEE: ON, RELAIS_RESISTANCE: OFF}, Phase.MODULATION,
+        duree=180.0, cycle_vis=(2.0, 6.0)),
+    Phase.MODULATION: DefinitionPhase(
+        {RELAIS_MOTEUR_FUMEE: ON, RELAIS_RESISTANCE: OFF}, Phase.MODULATION,
+        cycle_vis=(2.0, 6.0)),  # Marche de la vis recalculée par `duty_modulation`
+    Phase.REFROIDISSEMENT: DefinitionPhase(
+        {RELAIS_MOTEUR_FUMEE: ON, RELAIS_VIS_PELLET: OFF, RELAIS_RESISTANCE: OFF}, Phase.ARRET,
+        condition='fumees_froides', delai_max=3600.0),
+    Phase.ECHEC: DefinitionPhase(
+        {RELAIS_MOTEUR_FUMEE: OFF, RELAIS_VIS_PELLET: OFF, RELAIS_RESISTANCE: OFF}, Phase.ECHEC),
+    # Refroidissement inachevé : l'extraction n'est jamais coupée tant que les fumées sont chaudes
+    Phase.ECHEC_FUMEES_CHAUDES: DefinitionPhase(
+        {RELAIS_MOTEUR_FUMEE: ON, RELAIS_VIS_PELLET: OFF, RELAIS_RESISTANCE: OFF}, Phase.ECHEC_FUMEES_CHAUDES),
+}
+
+PHASES_ECHEC = (Phase.ECHEC, Phase.ECHEC_FUMEES_CHAUDES)
+
+
+@dataclass
+class BilanAllumage:
+    debut: float  # time.time() de la demande
+    temps_flamme: Optional[float] = None
+    pellets_grammes: float = 0.0
+    echec: Optional[str] = None
+
+
+@dataclass
+class ParametresSequence:
+    debit_vis: float = 1.2  # Grammes de pellets par seconde de vis
+    delta_flamme: float = 25.0  # Hausse de température des fumées signalant la flamme (°C)
+    temperature_fumees_froides: float = 60.0
+    duty_min: float = 0.15
+    duty_max: float = 0.8
+    # Régulateur PI(D) de la modulation : part de marche de la vis en fonction de l'écart à la consigne (°C)
+    pid_kp: float = 0.15
+    pid_ki: float = 0.0
+    pid_kd: float = 0.0
+    periode_pid: float = 10.0  # Le DHT11 n'est lu que toutes les 2 s, au degré près
+    historique_bilans: int = 50
+
+
+class Sequenceur:
+    """
+    Cycle de vie du poêle sous forme de machine à états pilotée par TABLE_PHASES.
+
+    Tous les délais reposent sur une horloge monotone ; `evaluer` peut être appelé par le thread
+    interne ou directement (simulation avec une horloge virtuelle).
+    """
+
+    def __init__(self, relais, lire_fumee: Callable[[], Optional[float]],
+                 lire_consigne: Callable[[], float], lire_ambiante: Callable[[], Optional[float]],
+                 est_verrouille: Callable[[], bool] = lambda: False,
+                 sur_evenement: Optional[Callable[[str, str], None]] = None,
+                 sur_phase: Optional[Callable[[Phase], None]] = None,
+                 parametres: Optional[ParametresSequence] = None,
+                 table: Dict[Phase, DefinitionPhase] = TABLE_PHASES,
+                 horloge: Callable[[], float] = time.monotonic, periode: float = 0.1):
+        self.relais = relais
+        self.lire_fumee = lire_fumee
+        self.lire_consigne = lire_consigne
+        self.lire_ambiante = lire_ambiante
+        self.est_verrouille = est_verrouille
+        self.sur_evenement = sur_evenement
+        self.sur_phase = sur_phase
+        self.parametres = parametres or ParametresSequence()
+        self.table = table
+        self.horloge = horloge
+        self.periode = periode
+
+        self.phase = Phase.ARRET
+        self.entree_phase = horloge()
+        self.fumee_reference: Optional[float] = None
+        self.sorties_commandees: Dict[int, RelayState] = {}
+        self.vis_depuis: Optional[float] = None
+        self.bilan: Optional[BilanAllumage] = None
+        self.demande_allumage = 0.0
+        self.cause_echec: Optional[str] = None
+        self.duty = self.parametres.duty_min
+        self.pid_integrale = 0.0
+        self.pid_erreur: Optional[float] = None
+        self.pid_instant: Optional[float] = None
+        self.bilans = deque(maxlen=self.parametres.historique_bilans)
+        self.verrou = threading.RLock()
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+
+    # --- Commandes -------------------------------------------------------
+
+    def allumer(self) -> bool:
+        """
+        Lance la séquence d'allumage (depuis l'arrêt uniquement). Refusé sans mesure de la température
+        des fumées : ni la détection de flamme ni la fin du refroidissement ne pourraient être constatées.
+        """
+        with self.verrou:
+            if self.phase != Phase.ARRET or self.lire_fumee() is None:
+                return False
+            maintenant = self.horloge()
+            self.demande_allumage = maintenant
+            self.cause_echec = None
+            self.bilan = BilanAllumage(debut=time.time())
+            self._entrer(Phase.PRE_VENTILATION, maintenant)
+            return True
+
+    def eteindre(self):
+        """Lance l'extinction : la vis s'arrête, l'extracteur tourne jusqu'au refroidissement des fumées."""
+        with self.verrou:
+            if self.phase not in (Phase.ARRET, Phase.REFROIDISSEMENT) + PHASES_ECHEC:
+                self._entrer(Phase.REFROIDISSEMENT, self.horloge())
+
+    def echouer(self, cause: str):
+        """Abandonne le cycle en cours (défaut de sécurité, délai dépassé) : refroidissement puis échec."""
+        with self.verrou:
+            if self.phase in (Phase.ARRET,) + PHASES_ECHEC:
+                return
+            self.cause_echec = cause
+            ECHECS_ALLUMAGE.incrementer()
+            self._cloturer_bilan(echec=cause)
+            self._evenement("Échec", f"{cause} (phase {self.phase})")
+            if self.phase != Phase.REFROIDISSEMENT:
+                self._entrer(Phase.REFROIDISSEMENT, self.horloge())
+
+    def acquitter(self) -> bool:
+        """
+        Ramène le séquenceur de l'échec à l'arrêt ; refusé tant que les fumées d'un refroidissement
+        inachevé sont chaudes (l'extracteur continue de tourner).
+        """
+        with self.verrou:
+            if self.phase not in PHASES_ECHEC:
+                return self.phase == Phase.ARRET
+            if self.phase == Phase.ECHEC_FUMEES_CHAUDES and not self.fumees_froides():
+                return False
+            self.cause_echec = None
+            self.sorties_commandees.clear()  # Les sorties ont pu être forcées pendant le verrouillage
+            self._entrer(Phase.ARRET, self.horloge())
+            return True
+
+    # --- Conditions de la table -----------------------------------------
+
+    def flamme_detectee(self) -> bool:
+        fumee = self.lire_fumee()
+        if fumee is None:
+            return False
+        if self.fumee_reference is None:
+            self.fumee_reference = fumee  # Référence prise à la première mesure valide de la phase
+            return False
+        return fumee - self.fumee_reference >= self.parametres.delta_flamme
+
+    def fumees_froides(self) -> bool:
+        fumee = self.lire_fumee()
+        return fumee is not None and fumee <= self.parametres.temperature_fumees_froides
+
+    def duty_modulation(self, maintenant: float) -> float:
+        """
+        Part de marche de la vis en modulation, recalculée toutes les `periode_pid` secondes.
+        L'intégrale n'est accumulée que si la sortie n'est pas saturée (anti-emballement) ;
+        Reglage_PID.simuler_lot reproduit exactement cette loi.
+        """
+        p = self.parametres
+        if self.pid_instant is not None and maintenant - self.pid_instant < p.periode_pid:
+            return self.duty
+        ambiante = self.lire_ambiante()
+        if ambiante is None:
+            self.duty = p.duty_min
+            return self.duty
+        erreur = self.lire_consigne() - ambiante
+        dt = p.periode_pid if self.pid_instant is None else maintenant - self.pid_instant
+        derivee = 0.0 if self.pid_erreur is None else (erreur - self.pid_erreur) / dt
+        integrale = self.pid_integrale + erreur * dt
+        brut = p.duty_min + p.pid_kp * erreur + p.pid_ki * integrale + p.pid_kd * derivee
+        if p.duty_min <= brut <= p.duty_max:
+            self.pid_integrale = integrale
+        else:
+            brut = p.duty_min + p.pid_kp * erreur + p.pid_ki * self.pid_integrale + p.pid_kd * derivee
+        self.duty = min(p.duty_max, max(p.duty_min, brut))
+        self.pid_erreur, self.pid_instant = erreur, maintenant
+        return self.duty
+
+    @property
+    def duty_courant(self) -> float:
+        """Part de marche moyenne de la vis dans la phase en cours (enregistrée en télémétrie)."""
+        cycle = self.table[self.phase].cycle_vis
+        if cycle is None:
+            return 0.0
+        return self.duty if self.phase == Phase.MODULATION else cycle[0] / cycle[1]
+
+    # --- Moteur de la machine à états ------------------------------------
+
+    def _entrer(self, phase: Phase, maintenant: float):
+        precedente = self.phase
+        self.phase = phase
+        self.entree_phase = maintenant
+        if phase == Phase.DETECTION_FLAMME:
+            self.fumee_reference = self.lire_fumee()
+        elif phase == Phase.MODULATION:
+            self.pid_integrale, self.pid_erreur, self.pid_instant = 0.0, None, None
+        for canal, etat in self.table[phase].sorties.items():
+            self._commander(canal, etat, maintenant)
+        if self.table[phase].cycle_vis is None:
+            self._commander(RELAIS_VIS_PELLET, OFF, maintenant)
+        if precedente != phase:
+            self._evenement("Séquence", f"{precedente} → {phase}")
+            if self.sur_phase is not None:
+                self.sur_phase(phase)
+
+    def _commander(self, canal: int, etat: RelayState, maintenant: float):
+        """Envoie la commande seulement si l'état change, et comptabilise le temps de marche de la vis."""
+        # Le chien de garde force les relais sans passer par le séquenceur : l'état connu du module
+        # fait foi autant que la dernière commande envoyée
+        if self.sorties_commandees.get(canal) == etat and self.relais.states[canal - 1] == etat:
+            return
+        if self.est_verrouille() and (etat == OFF) == (canal == RELAIS_MOTEUR_FUMEE):
+            return  # Le chien de garde impose l'état sûr (extracteur en marche) jusqu'à l'acquittement
+        if canal == RELAIS_VIS_PELLET:
+            if etat == ON:
+                self.vis_depuis = maintenant
+            else:
+                self._compter_vis(maintenant)
+                self.vis_depuis = None
+        self.sorties_commandees[canal] = etat
+        self.relais.definir_relais(canal, etat, PrioriteCommande.CONTROLE)
+
+    def _compter_vis(self, maintenant: float):
+        if self.vis_depuis is not None and self.bilan is not None and self.bilan.temps_flamme is None:
+            self.bilan.pellets_grammes += (maintenant - self.vis_depuis) * self.parametres.debit_vis
+            self.vis_depuis = maintenant
+
+    def evaluer(self, maintenant: Optional[float] = None):
+        """Un pas de la machine à états : vis pulsée, transitions, délais."""
+        with self.verrou:
+            maintenant = self.horloge() if maintenant is None else maintenant
+            if self.est_verrouille() and self.phase not in (Phase.ARRET, Phase.REFROIDISSEMENT) + PHASES_ECHEC:
+                self.echouer("Mise en sécurité par le chien de garde")
+            definition = self.table[self.phase]
+            ecoule = maintenant - self.entree_phase
+
+            if definition.cycle_vis is not None:
+                marche, periode = definition.cycle_vis
+                if self.phase == Phase.MODULATION:
+                    marche = periode * self.duty_modulation(maintenant)
+                self._compter_vis(maintenant)
+                self._commander(RELAIS_VIS_PELLET, ON if ecoule % periode < marche else OFF, maintenant)
+
+            if definition.condition is not None and getattr(self, definition.condition)():
+                self._franchir(definition.suivante, maintenant)
+            elif definition.duree is not None and ecoule >= definition.duree:
+                self._franchir(definition.suivante, maintenant)
+            elif definition.delai_max is not None and ecoule >= definition.delai_max:
+                if self.phase == Phase.REFROIDISSEMENT:
+                    self.cause_echec = self.cause_echec or "Fumées toujours chaudes après refroidissement"
+                    self._entrer(Phase.ECHEC_FUMEES_CHAUDES, maintenant)
+                else:
+                    self.echouer(f"Délai dépassé en {self.phase}")
+
+    def _franchir(self, suivante: Phase, maintenant: float):
+        if self.phase == Phase.DETECTION_FLAMME:
+            self._compter_vis(maintenant)
+            self.bilan.temps_flamme = maintenant - self.demande_allumage
+            TEMPS_FLAMME.observer(self.bilan.temps_flamme)
+            PELLETS_ALLUMAGE.observer(self.bilan.pellets_grammes)
+            self._evenement("Allumage", f"Flamme en {self.bilan.temps_flamme:.0f} s, "
+                                        f"{self.bilan.pellets_grammes:.0f} g de pellets")
+            self._cloturer_bilan()
+        if self.phase == Phase.REFROIDISSEMENT and self.cause_echec is not None:
+            suivante = Phase.ECHEC
+        self._entrer(suivante, maintenant)
+
+    def _cloturer_bilan(self, echec: Optional[str] = None):
+        if self.bilan is not None:
+            self.bilan.echec = echec
+            self.bilans.append(self.bilan)
+            self.bilan = None
+
+    def _evenement(self, type_event: str, details: str):
+        if self.sur_evenement is not None:
+            self.sur_evenement(type_event, details)
+
+    # --- Thread ----------------------------------------------------------
+
+    def demarrer(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._executer, name='sequenceur', daemon=True)
+        self.thread.start()
+
+    def _executer(self):
+        while self.running:
+            try:
+                self.evaluer()
+            except Exception as e:
+                self._evenement("Erreur", f"Séquenceur: {e}")
+            time.sleep(self.periode)
+
+    def arreter(self, delai: float = 1.0):
+        """
+        Arrête le thread puis coupe la vis et la résistance en priorité sécurité, en attendant leur écriture :
+        à la sortie du programme, aucune des deux ne doit rester enclenchée sur le module. L'extracteur
+        est laissé dans son état pour continuer d'évacuer les fumées.
+        """
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        with self.verrou:
+            self._compter_vis(self.horloge())
+            self.vis_depuis = None
+            ecritures = []
+            for canal in (RELAIS_VIS_PELLET, RELAIS_RESISTANCE):
+                self.sorties_commandees[canal] = OFF
+                ecritures.append(self.relais.forcer_relais(canal, OFF))
+        for ecrite in ecritures:
+            ecrite.wait(delai)
+
+
+if __name__ == "__main__":
+    # Simulation d'allumages sur horloge virtuelle avec un modèle thermique simplifié du foyer
+    from CH340 import RelayController
+    from Simulateur import PortSimule
+
+    relais = RelayController(serial_port=PortSimule(), espacement=0.0)
+    etat = {'horloge': 0.0, 'fumee': 20.0, 'braise': 0.0, 'flamme': False, 'ambiante': 18.0, 'panne': False}
+
+    sequenceur = Sequenceur(
+        relais,
+        lire_fumee=lambda: etat['fumee'],
+        lire_consigne=lambda: 21.0,
+        lire_ambiante=lambda: etat['ambiante'],
+        horloge=lambda: etat['horloge'],
+    )
+
+    def simuler(duree: float, pas: float = 0.5):
+        for _ in range(int(duree / pas)):
+            etat['horloge'] += pas
+            vis = relais.states[RELAIS_VIS_PELLET - 1] == ON
+            resistance = relais.states[RELAIS_RESISTANCE - 1] == ON
+            # Les pellets s'accumulent dans le creuset et s'enflamment une fois assez chauffés
+            etat['braise'] += 1.2 * pas if vis else 0.0
+            if not etat['flamme'] and resistance and not etat['panne'] and etat['braise'] > 15 and etat['fumee'] > 35:
+                etat['flamme'] = True
+            brule = 0.05 * etat['braise'] * pas if etat['flamme'] else 0.0
+            etat['braise'] -= brule
+            etat['flamme'] = etat['flamme'] and etat['braise'] > 0.5
+            chauffe = 0.3 if resistance else 0.0
+            etat['fumee'] += (chauffe - 0.01 * (etat['fumee'] - 20)) * pas + 2.0 * brule
+            etat['ambiante'] += (0.0004 * (etat['fumee'] - 20) - 0.001 * (etat['ambiante'] - 10)) * pas
+            sequenceur.evaluer()
+
+    # Trois allumages normaux puis une résistance en panne (échec sur délai de détection)
+    for essai in range(4):
+        etat['panne'] = essai == 3
+        etat['braise'] = 0.0
+        sequenceur.allumer()
+        simuler(1800)
+        phase_en_marche, ambiante = sequenceur.phase, etat['ambiante']
+        sequenceur.eteindre()
+        simuler(7200)
+        bilan = sequenceur.bilans[-1]
+        if bilan.echec:
+            print(f"Allumage {essai + 1} : échec « {bilan.echec} » après {bilan.pellets_grammes:.0f} g, "
+                  f"phase finale {sequenceur.phase}")
+        else:
+            print(f"Allumage {essai + 1} : flamme en {bilan.temps_flamme:.0f} s, {bilan.pellets_grammes:.1f} g, "
+                  f"{phase_en_marche} à 30 min (ambiante {ambiante:.1f} °C), phase finale {sequenceur.phase}")
+        sequenceur.acquitter()
+
+    # Conduit qui ne refroidit pas (fumées maintenues à 200 °C) : l'extraction ne doit jamais être coupée
+    etat['panne'], etat['braise'] = False, 0.0
+    sequenceur.allumer()
+    simuler(1800)
+    sequenceur.eteindre()
+    for _ in range(7200):
+        etat['horloge'] += 1.0
+        etat['fumee'] = 200.0
+        sequenceur.evaluer()
+    relais.ordonnanceur.attendre_vidage()
+    extraction = relais.states[RELAIS_MOTEUR_FUMEE - 1]
+    print(f"Fumées bloquées à 200 °C : phase {sequenceur.phase}, extracteur {extraction}, "
+          f"acquittement {'accepté' if sequenceur.acquitter() else 'refusé'}")
+    assert sequenceur.phase == Phase.ECHEC_FUMEES_CHAUDES and extraction == ON
+    etat['fumee'] = 40.0
+    assert sequenceur.acquitter() and sequenceur.phase == Phase.ARRET
+    relais.cleanup()
@@ -0,0 +1,136 @@
+import queue
+import re
+import threading
+from typing import List, Optional
+
+COMMANDE_RELAIS = re.compile(rb'AT\+([OCR])(\d+)')
+LIGNE_CANAL = re.compile(rb'CH(\d+): (ON|OFF)\s*')
+
+
+class PortSimule:
+    """
+    Remplace serial.Serial pour tester RelayController sans module CH340.
+
+    Avec `echo=True`, chaque commande AT+On / AT+Cn / AT+Rn reçoit la réponse « CHn: ON/OFF »
+    que renvoie le vrai module, après `latence` secondes. L'état rapporté par AT+Rn est le dernier
+    commandé ou injecté sur le canal.
+    """
+
+    def __init__(self, num_relays: int = 8, echo: bool = True, latence: float = 0.0, timeout: Optional[float] = 0.01):
+        self.num_relays = num_relays
+        self.echo = echo
+        self.latence = latence
+        self.timeout = timeout
+        self.is_open = True
+        self.ecritures: List[bytes] = []
+        self.etats = ['OFF'] * num_relays
+        self._entree: queue.Queue = queue.Queue()
+
+    @property
+    def in_waiting(self) -> int:
+        return self._entree.qsize()
+
+    def readline(self) -> bytes:
+        """Retourne la prochaine ligne reçue, ou b'' après `timeout` secondes."""
+        try:
+            return self._entree.get(timeout=self.timeout)
+        except queue.Empty:
+            return b''
+
+    def write(self, donnees: bytes) -> int:
+        self.ecritures.append(donnees)
+        if self.echo:
+            for reponse in self._reponses(donnees):
+                if self.latence:
+                    threading.Timer(self.latence, self._entree.put, (reponse,)).start()
+                else:
+                    self._entree.put(reponse)
+        return len(donnees)
+
+    def _reponses(self, donnees: bytes) -> List[bytes]:
+        """Réponses du module à une commande."""
+        if donnees in (b'AT+AO', b'AT+AC'):
+            self.etats = ['ON' if donnees == b'AT+AO' else 'OFF'] * self.num_relays
+            return [f'CH{i}: {self.etats[i - 1]}\r\n'.encode() for i in range(1, self.num_relays + 1)]
+        match = COMMANDE_RELAIS.fullmatch(donnees)
+        if match and 1 <= int(match.group(2)) <= self.num_relays:
+            canal = int(match.group(2))
+            if match.group(1) != b'R':
+                self.etats[canal - 1] = 'ON' if match.group(1) == b'O' else 'OFF'
+            return [f'CH{canal}: {self.etats[canal - 1]}\r\n'.encode()]
+        return []
+
+    def injecter(self, ligne: bytes):
+        """Simule une ligne envoyée spontanément par le module (retour d'une entrée par exemple)."""
+        match = LIGNE_CANAL.fullmatch(ligne)
+        if match and 1 <= int(match.group(1)) <= self.num_relays:
+            self.etats[int(match.group(1)) - 1] = match.group(2).decode()
+        self._entree.put(ligne)
+
+    def close(self):
+        self.is_open = False
+
+
+if __name__ == "__main__":
+    # Latence de détection d'une entrée (canal 8, presostat) basculée sur un module simulé
+    import time
+    from CH340 import PrioriteCommande, RelayController
+
+    for anti_rebond in (0.0, 0.05):
+        port = PortSimule()
+        relais = RelayController(serial_port=port, anti_rebond=anti_rebond)
+        detections = []
+        relais.entrees[8].abonner(lambda canal, etat, arrivee: detections.append(time.perf_counter()))
+
+        latences = []
+        for essai in range(100):
+            attendues = len(detections) + 1
+            injection = time.perf_counter()
+            port.injecter(b'CH8: ON\r\n' if essai % 2 == 0 else b'CH8: OFF\r\n')
+            while len(detections) < attendues:
+                time.sleep(0.0002)
+            latences.append(detections[-1] - injection)
+        relais.cleanup()
+
+        latences.sort()
+        print(f"Anti-rebond {anti_rebond * 1000:.0f} ms : médiane {latences[50] * 1000:.2f} ms, "
+              f"max {latences[-1] * 1000:.2f} ms")
+
+    # Latence d'une commande d'urgence sur un bus saturé (interrogations + commandes utilisateur)
+    for classe_urgence in (PrioriteCommande.SECURITE, PrioriteCommande.UTILISATEUR):
+        relais = RelayController(serial_port=PortSimule(), espacement=0.005)
+        saturation = True
+
+        def saturer(priorite):
+            while saturation:
+                if relais.ordonnanceur.profondeurs[priorite] < 200:
+                    if priorite == PrioriteCommande.INTERROGATION:
+                        relais.demander_etat(2)
+                    else:
+                        relais.toggle_relay(2, priorite)
+                time.sleep(0.001)
+
+        threads = [threading.Thread(target=saturer, args=(priorite,), daemon=True)
+                   for priorite in (PrioriteCommande.INTERROGATION, PrioriteCommande.UTILISATEUR)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.5)
+
+        latences = []
+        for _ in range(30):
+            debut = time.perf_counter()
+            relais.ordonnanceur.soumettre(relais.commands[2].OFF, classe_urgence).wait()
+            latences.append(time.perf_counter() - debut)
+            time.sleep(0.02)
+        saturation = False
+        stats = relais.ordonnanceur.statistiques()
+        relais.cleanup()
+
+        latences.sort()
+        print(f"Urgence en classe {classe_urgence.name.lower():12s}: médiane {latences[15] * 1000:.1f} ms, "
+              f"max {latences[-1] * 1000:.1f} ms (espacement 5 ms)")
+        if classe_urgence != PrioriteCommande.SECURITE:
+            continue  # Les histogrammes du registre sont cumulés : statistiques du premier passage seulement
+        for classe, valeurs in stats.items():
+            print(f"    {classe:13s} profondeur {valeurs['profondeur']:4d}  commandes {valeurs['commandes']:5d}  "
+                  f"attente moyenne {valeurs['attente_moyenne'] * 1000:.1f} ms")
@@ -0,0 +1,69 @@
+import glob
+import os
+from typing import List, Optional
+from Metriques import REGISTRE
+
+# Sonde de température des fumées : thermocouple K sur un MAX31850K, bus 1-Wire sur la broche 13 (GPIO 27),
+# lu par le pilote noyau w1_therm. Nécessite dans /boot/firmware/config.txt : dtoverlay=w1-gpio,gpiopin=27
+REPERTOIRE_W1 = '/sys/bus/w1/devices'
+FAMILLE_MAX31850 = '3b-'
+
+DUREE_LECTURE = REGISTRE.histogramme('sonde_fumee_lecture_secondes', "Durée d'une lecture de la sonde des fumées")
+LECTURES = REGISTRE.compteur('sonde_fumee_lectures_total', 'Lectures de la sonde des fumées')
+ECHECS = REGISTRE.compteur('sonde_fumee_echecs_total', 'Lectures de la sonde des fumées sans mesure exploitable')
+
+
+def trouver_sonde(repertoire: str = REPERTOIRE_W1) -> Optional[str]:
+    """Chemin du fichier w1_slave du premier MAX31850 du bus, None si aucun n'est détecté."""
+    chemins = sorted(glob.glob(os.path.join(repertoire, FAMILLE_MAX31850 + '*', 'w1_slave')))
+    return chemins[0] if chemins else None
+
+
+SONDE = trouver_sonde()
+DISPONIBLE = SONDE is not None
+
+
+def lire_temperature(chemin: Optional[str] = None) -> Optional[float]:
+    """Température des fumées en °C, None si la lecture échoue (comptée dans sonde_fumee_echecs_total)."""
+    LECTURES.incrementer()
+    with DUREE_LECTURE.chronometrer():
+        try:
+            # La lecture déclenche une conversion (moins de 100 ms pour le MAX31850)
+            with open(chemin or SONDE, 'r') as f:
+                lignes = f.read().splitlines()
+        except (OSError, TypeError):
+            lignes = []
+    temperature = decoder_w1_slave(lignes)
+    if temperature is None:
+        ECHECS.incrementer()
+    return temperature
+
+
+def decoder_w1_slave(lignes: List[str]) -> Optional[float]:
+    """
+    Décode le contenu de w1_slave :
+        72 01 00 00 f0 ff ff ff 5a : crc=5a YES
+        72 01 00 00 f0 ff ff ff 5a t=23125
+    None si le CRC est invalide, si le MAX31850 signale un défaut du thermocouple (bit 0 du premier octet :
+    thermocouple ouvert ou en court-circuit) ou si la ligne est incomplète.
+    """
+    if len(lignes) < 2 or not lignes[0].endswith('YES'):
+        return None
+    octets, _, valeur = lignes[1].partition(' t=')
+    try:
+        if int(octets.split()[0], 16) & 0x01:
+            return None
+        return int(valeur) / 1000.0
+    except (ValueError, IndexError):
+        return None
+
+
+if __name__ == "__main__":
+    if not DISPONIBLE:
+        print(f"Aucun MAX31850 dans {REPERTOIRE_W1} (dtoverlay=w1-gpio,gpiopin=27 activé ?)")
+    else:
+        temperature = lire_temperature()
+        if temperature is not None:
+            print(f"Température des fumées : {temperature:.2f}°C ({SONDE})")
+        else:
+            print("Erreur : lecture de la sonde impossible (CRC invalide ou thermocouple en défaut).")
@@ -0,0 +1,100 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+from typing import Callable, Optional
+
+# Constantes inotify (voir <sys/inotify.h>)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CLOEXEC = os.O_CLOEXEC
+IN_NONBLOCK = os.O_NONBLOCK
+
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+FORMAT_EVENEMENT = 'iIII'
+TAILLE_EVENEMENT = struct.calcsize(FORMAT_EVENEMENT)
+
+
+def _charger_libc():
+    """Charge la libc pour accéder aux appels système inotify."""
+    nom = ctypes.util.find_library('c') or 'libc.so.6'
+    libc = ctypes.CDLL(nom, use_errno=True)
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_init1.restype = ctypes.c_int
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_add_watch.restype = ctypes.c_int
+    return libc
+
+
+class SurveillanceFichier:
+    """
+    Surveille un fichier via inotify et appelle `rappel` à chaque modification externe.
+
+    C'est le répertoire parent qui est surveillé : la plupart des éditeurs enregistrent
+    dans un fichier temporaire puis le renomment, ce qui remplacerait l'inode surveillé.
+    """
+
+    def __init__(self, fichier: str, rappel: Callable[[str], None]):
+        self.fichier = os.path.abspath(fichier)
+        self.repertoire = os.path.dirname(self.fichier)
+        self.nom = os.path.basename(self.fichier).encode()
+        self.rappel = rappel
+        self.running = False
+        self.fd: Optional[int] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def demarrer(self):
+        """Ouvre le descripteur inotify et démarre le thread de surveillance."""
+        libc = _charger_libc()
+        fd = libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1: {os.strerror(errno)}")
+        if libc.inotify_add_watch(fd, self.repertoire.encode(), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, f"inotify_add_watch {self.repertoire}: {os.strerror(errno)}")
+
+        self.fd = fd
+        self.running = True
+        self.thread = threading.Thread(target=self._surveiller, daemon=True)
+        self.thread.start()
+
+    def _surveiller(self):
+        """Attend les événements inotify sans interroger le fichier périodiquement."""
+        while self.running:
+            # Le délai ne sert qu'à vérifier `running` pour pouvoir s'arrêter proprement
+            prets, _, _ = select.select([self.fd], [], [], 0.5)
+            if not prets:
+                continue
+            try:
+                donnees = os.read(self.fd, 4096)
+            except BlockingIOError:
+                continue
+            except OSError:
+                break
+            if self.nom in self._noms_modifies(donnees):
+                self.rappel(self.fichier)
+
+    @staticmethod
+    def _noms_modifies(donnees: bytes):
+        """Décode un tampon d'événements inotify et retourne les noms de fichiers concernés."""
+        noms = set()
+        offset = 0
+        while offset + TAILLE_EVENEMENT <= len(donnees):
+            _, _, _, longueur = struct.unpack_from(FORMAT_EVENEMENT, donnees, offset)
+            offset += TAILLE_EVENEMENT
+            noms.add(donnees[offset:offset + longueur].rstrip(b'\0'))
+            offset += longueur
+        return noms
+
+    def arreter(self):
+        """Arrête la surveillance et libère le descripteur."""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
@@ -0,0 +1,129 @@
+import math
+import sys
+from array import array
+from typing import Dict, List, Optional, Sequence
+
+SYMBOLES = '▁▂▃▄▅▆▇█'
+
+
+class Tendance:
+    """
+    Historique d'un capteur à plusieurs résolutions, dans des tampons circulaires array('f') de taille fixe.
+
+    Le niveau 0 reçoit chaque échantillon ; chaque niveau suivant reçoit la moyenne de `facteurs[n]`
+    points du niveau précédent, calculée au fil de l'eau : un ajout coûte O(1) et l'affichage ne
+    réagrège jamais le tampon.
+    """
+
+    def __init__(self, capacite: int = 120, facteurs: Sequence[int] = (1, 15, 12)):
+        self.capacite = capacite
+        self.facteurs = tuple(facteurs)
+        self.tampons = [array('f', [math.nan]) * capacite for _ in self.facteurs]
+        self.positions = [0] * len(self.facteurs)  # Prochain emplacement écrit de chaque niveau
+        self.sommes = [0.0] * len(self.facteurs)  # Agrégat en cours destiné à chaque niveau
+        self.valides = [0] * len(self.facteurs)
+        self.recus = [0] * len(self.facteurs)
+        self.derniere = math.nan
+
+    def ajouter(self, valeur: Optional[float]):
+        """Ajoute un échantillon (None ou NaN = mesure absente)."""
+        self.derniere = math.nan if valeur is None else float(valeur)
+        self._pousser(0, self.derniere)
+
+    def _pousser(self, niveau: int, valeur: float):
+        self.tampons[niveau][self.positions[niveau]] = valeur
+        self.positions[niveau] = (self.positions[niveau] + 1) % self.capacite
+        suivant = niveau + 1
+        if suivant == len(self.tampons):
+            return
+        self.recus[suivant] += 1
+        if valeur == valeur:  # Les mesures absentes (NaN) sont exclues de la moyenne
+            self.sommes[suivant] += valeur
+            self.valides[suivant] += 1
+        if self.recus[suivant] == self.facteurs[suivant]:
+            moyenne = self.sommes[suivant] / self.valides[suivant] if self.valides[suivant] else math.nan
+            self.sommes[suivant], self.valides[suivant], self.recus[suivant] = 0.0, 0, 0
+            self._pousser(suivant, moyenne)
+
+    def pas(self, niveau: int) -> int:
+        """Nombre d'échantillons bruts représentés par un point du niveau."""
+        return math.prod(self.facteurs[1:niveau + 1])
+
+    def serie(self, niveau: int, nombre: Optional[int] = None) -> List[float]:
+        """Les `nombre` derniers points du niveau, du plus ancien au plus récent."""
+        tampon, position = self.tampons[niveau], self.positions[niveau]
+        points = tampon[position:] + tampon[:position]
+        return points.tolist()[-(nombre or self.capacite):]
+
+    def memoire_octets(self) -> int:
+        return sum(sys.getsizeof(tampon) for tampon in self.tampons)
+
+
+def sparkline(valeurs: Sequence[float], minimum: Optional[float] = None, maximum: Optional[float] = None) -> str:
+    """Une ligne de blocs ▁…█ ; les points absents sont laissés vides."""
+    presentes = [v for v in valeurs if v == v]
+    if not presentes:
+        return ' ' * len(valeurs)
+    bas = min(presentes) if minimum is None else minimum
+    haut = max(presentes) if maximum is None else maximum
+    echelle = (len(SYMBOLES) - 1) / (haut - bas) if haut > bas else 0.0
+    return ''.join(
+        SYMBOLES[min(len(SYMBOLES) - 1, max(0, round((v - bas) * echelle)))] if v == v else ' '
+        for v in valeurs
+    )
+
+
+class Tendances:
+    """Tendances des capteurs suivis, alimentées par la boucle de contrôle."""
+
+    def __init__(self, noms: Sequence[str], periode: float, capacite: int = 120, facteurs: Sequence[int] = (1, 15, 12)):
+        self.periode = periode  # Secondes entre deux échantillons
+        self.courbes: Dict[str, Tendance] = {nom: Tendance(capacite, facteurs) for nom in noms}
+
+    def echantillonner(self, valeurs: Dict[str, Optional[float]]):
+        for nom, courbe in self.courbes.items():
+            courbe.ajouter(valeurs.get(nom))
+
+    def duree_fenetre(self, niveau: int) -> float:
+        """Durée couverte par un tampon complet du niveau, en secondes."""
+        courbe = next(iter(self.courbes.values()))
+        return courbe.capacite * courbe.pas(niveau) * self.periode
+
+
+if __name__ == "__main__":
+    # Coût d'un échantillon, d'une image de l'écran des tendances et mémoire par capteur
+    import random
+    import timeit
+
+    noms = ('Température ambiante', 'Humidité', 'Température fumée', 'Vitesse moteur fumée')
+    tendances = Tendances(noms, periode=1.0)
+    random.seed(1)
+    for i in range(24 * 3600):
+        tendances.echantillonner({nom: 20 + 5 * math.sin(i / 3000) + random.random() for nom in noms})
+
+    largeur = 100
+    humidite = tendances.courbes['Humidité']
+    print(f"Humidité sur {tendances.duree_fenetre(2) / 3600:.0f} h : {sparkline(humidite.serie(2, largeur))}")
+
+    n = 100_000
+    valeurs = {nom: 21.0 for nom in noms}
+    duree = timeit.timeit(lambda: tendances.echantillonner(valeurs), number=n)
+    print(f"Échantillonnage des {len(noms)} capteurs : {duree / n * 1e6:.2f} µs par tick")
+
+    for niveau in range(3):
+        def image():
+            return [sparkline(courbe.serie(niveau, largeur)) for courbe in tendances.courbes.values()]
+        duree = min(timeit.repeat(image, number=200, repeat=5)) / 200
+        print(f"Image niveau {niveau} ({tendances.duree_fenetre(niveau) / 60:4.0f} min) : "
+              f"{duree * 1e6:.0f} µs pour {len(noms)} capteurs")
+
+    # Référence : réagréger à chaque image un historique brut de 6 h (ce que les niveaux évitent)
+    brut = array('f', humidite.serie(0)) * 180
+    def image_reagregee():
+        pas = len(brut) // largeur
+        return sparkline([sum(brut[i * pas:(i + 1) * pas]) / pas for i in range(largeur)])
+    duree = min(timeit.repeat(image_reagregee, number=20, repeat=5)) / 20
+    print(f"Réagrégation complète de 6 h pour un seul capteur : {duree * 1e6:.0f} µs")
+
+    print(f"Mémoire par capteur : {humidite.memoire_octets()} octets "
+          f"({len(humidite.tampons)} niveaux de {humidite.capacite} points float32)")
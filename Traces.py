@@ -0,0 +1,101 @@
+import json
+import os
+import signal
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+
+class _SpanNul:
+    """Span renvoyé quand le traçage est désactivé : ne fait rien."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+SPAN_NUL = _SpanNul()
+
+
+class _Span:
+    __slots__ = ('traceur', 'nom', 'args', 'debut')
+
+    def __init__(self, traceur: 'Traceur', nom: str, args: Optional[dict]):
+        self.traceur = traceur
+        self.nom = nom
+        self.args = args
+
+    def __enter__(self):
+        self.debut = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.traceur.enregistrer(self.nom, self.debut, time.perf_counter_ns(), self.args)
+        return False
+
+
+class Traceur:
+    """
+    Enregistre des spans dans un tampon circulaire et les exporte au format
+    Chrome trace-event (ouvrable dans chrome://tracing ou Perfetto).
+    """
+
+    def __init__(self, capacite: int = 10000, actif: bool = False):
+        self.actif = actif
+        self.evenements = deque(maxlen=capacite)
+        self.attentes: Dict[str, int] = {}
+        self.pid = os.getpid()
+
+    def span(self, nom: str, args: Optional[dict] = None):
+        """Gestionnaire de contexte mesurant le bloc ; quasi gratuit si le traçage est désactivé."""
+        if not self.actif:
+            return SPAN_NUL
+        return _Span(self, nom, args)
+
+    def enregistrer(self, nom: str, debut_ns: int, fin_ns: int, args: Optional[dict] = None):
+        """Ajoute un span terminé (horodatages perf_counter_ns)."""
+        # deque.append est atomique : pas de verrou nécessaire entre threads
+        self.evenements.append((nom, debut_ns, fin_ns, threading.get_ident(), args))
+
+    def ouvrir_attente(self, nom: str):
+        """Démarre un span qui sera fermé par un autre thread (acquittement, réponse capteur...)."""
+        if self.actif:
+            self.attentes[nom] = time.perf_counter_ns()
+
+    def fermer_attente(self, nom: str, args: Optional[dict] = None):
+        """Ferme un span ouvert par `ouvrir_attente`, s'il y en a un."""
+        if not self.attentes:
+            return
+        debut = self.attentes.pop(nom, None)
+        if debut is not None:
+            self.enregistrer(nom, debut, time.perf_counter_ns(), args)
+
+    def exporter_chrome(self, chemin: str) -> int:
+        """Écrit les spans du tampon au format Chrome trace-event JSON. Retourne le nombre de spans."""
+        evenements = [
+            {
+                'name': nom,
+                'ph': 'X',
+                'ts': debut / 1000,
+                'dur': (fin - debut) / 1000,
+                'pid': self.pid,
+                'tid': tid,
+                'args': args or {},
+            }
+            for nom, debut, fin, tid, args in list(self.evenements)
+        ]
+        with open(chemin, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': evenements, 'displayTimeUnit': 'ms'}, f)
+        return len(evenements)
+
+    def installer_export_signal(self, chemin: str, signum: int = signal.SIGUSR1):
+        """Exporte la trace dans `chemin` à la réception du signal (kill -USR1 <pid>)."""
+        signal.signal(signum, lambda *_: self.exporter_chrome(chemin))
+
+
+# Traceur global, activé avec la variable d'environnement POELE_TRACE=1
+TRACEUR = Traceur(actif=os.environ.get('POELE_TRACE') == '1')